@@ -21,7 +21,6 @@ Misha Schwartz, and Jaisie Sin
 
 This file contains the different actions that can be made by a Player.
 """
-import pygame
 
 # Actions that can be performed in the game
 ROTATE_CLOCKWISE = ('rotate', 1)
@@ -66,15 +65,17 @@ ACTION_PENALTY = {
     PASS: 0
 }
 
+# The pygame key code of each of these keys is the code of its character, so
+# the keys are given that way, and the actions can be used without pygame.
 ACTION_KEY = {
-    ROTATE_CLOCKWISE: pygame.K_d,
-    ROTATE_COUNTER_CLOCKWISE: pygame.K_a,
-    SWAP_HORIZONTAL: pygame.K_q,
-    SWAP_VERTICAL: pygame.K_e,
-    SMASH: pygame.K_SPACE,
-    COMBINE: pygame.K_c,
-    PAINT: pygame.K_r,
-    PASS: pygame.K_TAB
+    ROTATE_CLOCKWISE: ord('d'),
+    ROTATE_COUNTER_CLOCKWISE: ord('a'),
+    SWAP_HORIZONTAL: ord('q'),
+    SWAP_VERTICAL: ord('e'),
+    SMASH: ord(' '),
+    COMBINE: ord('c'),
+    PAINT: ord('r'),
+    PASS: ord('\t')
 }
 
 # Create a dictionary that is ACTION_KEY inverted
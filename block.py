@@ -22,17 +22,33 @@ Misha Schwartz, and Jaisie Sin
 This file contains the Block class, the main data structure used in the game.
 """
 from __future__ import annotations
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union
 import random
 import math
+import struct
+import numpy as np
 
 from settings import colour_name, COLOUR_LIST
+from linear_block import LinearBlock, generate_linear_board
+from zobrist import leaf_key, parent_key
 
+# The number of painted squares that a ColourGrid remembers.
+_GRID_LOG_LIMIT = 4096
 
-def generate_board(max_depth: int, size: int) -> Block:
+# The layout of the header of an encoded board: its level, max_depth, size and
+# position, and the code of a block with children in an encoded board.
+_HEADER = struct.Struct('>BBIii')
+_PARENT_CODE = 255
+
+
+def generate_board(max_depth: int, size: int, compact: bool = False) -> \
+        Union[Block, LinearBlock]:
     """Return a new game board with a depth of <max_depth> and dimensions of
     <size> by <size>.
 
+    If <compact> is True, the board is a LinearBlock, which stores the whole
+    tree in flat arrays and needs far less memory for deep boards.
+
     >>> board = generate_board(3, 750)
     >>> board.max_depth
     3
@@ -40,13 +56,81 @@ def generate_board(max_depth: int, size: int) -> Block:
     750
     >>> len(board.children) == 4
     True
+    >>> generate_board(3, 750, True).max_depth
+    3
     """
+    if compact:
+        return generate_linear_board(max_depth, size)
+
     board = Block((0, 0), size, random.choice(COLOUR_LIST), 0, max_depth)
     board.smash()
 
     return board
 
 
+def encode_board(board: Block) -> bytes:
+    """Return a compact encoding of <board>, from which decode_board makes a
+    Block equal to <board>.
+
+    After a short header, each block takes one byte, in the order of a
+    preorder traversal: the index in COLOUR_LIST of the colour of a leaf, or
+    a code for a block with children. <board> is not changed or copied.
+
+    >>> board = generate_board(3, 750)
+    >>> decode_board(encode_board(board)) == board
+    True
+    >>> board = generate_board(3, 750, compact=True)
+    >>> str(decode_board(encode_board(board))) == str(board)
+    True
+    """
+    codes = bytearray()
+    # as in Block.leaves, pending rotations are carried down to the children
+    pending = [(board, 0)]
+    while len(pending) != 0:
+        block, turns = pending.pop()
+        if isinstance(block, Block):
+            children = block._children
+            turns = (turns + block._turns) % 4
+        else:
+            # the rotations of a LinearBlock are never pending
+            children = block.children
+        if len(children) == 0:
+            codes.append(COLOUR_LIST.index(block.colour))
+            continue
+
+        codes.append(_PARENT_CODE)
+        for i in range(3, -1, -1):
+            pending.append((children[(i + turns) % 4], turns))
+
+    header = _HEADER.pack(board.level, board.max_depth, board.size,
+                          board.position[0], board.position[1])
+    return header + bytes(codes)
+
+
+def decode_board(data: bytes) -> Block:
+    """Return the Block encoded in <data> by encode_board.
+    """
+    level, max_depth, size, x, y = _HEADER.unpack_from(data)
+    codes = data[_HEADER.size:]
+
+    board = Block((x, y), size, None, level, max_depth)
+    # the blocks whose codes come next, most recent last
+    pending = [board]
+    for code in codes:
+        block = pending.pop()
+        if code != _PARENT_CODE:
+            block._colour = COLOUR_LIST[code]
+            continue
+
+        positions = block._children_positions()
+        children = [Block(positions[i], block._child_size(), None,
+                          block.level + 1, max_depth) for i in range(4)]
+        block._children = children
+        pending.extend(reversed(children))
+
+    return board
+
+
 class Block:
     """A square Block in the Blocky game, represented as a tree.
 
@@ -92,12 +176,87 @@ class Block:
         - its colour is not None.
     - level <= max_depth
     """
+    # === Private Attributes ===
+    # _children:
+    #   The children of this Block as they are stored, before the pending
+    #   rotation in _turns is applied to them.
+    # _turns:
+    #   The number of clockwise quarter turns that have been applied to this
+    #   Block but not yet pushed down to its children.
+    # _frame:
+    #   The total number of clockwise quarter turns, modulo 4, that the
+    #   ancestors of this Block have pushed down to it. MoveJournal uses it to
+    #   undo swaps and combines in the right orientation.
+    # _stale:
+    #   True iff the order, positions or pending rotations of the children in
+    #   _children have not been brought up to date yet.
+    # _frozen:
+    #   True iff this Block may be shared by more than one board, in which case
+    #   it must never be changed. The descendants of a frozen Block are frozen
+    #   too, even if their own flag has not been set yet.
+    # _hashes:
+    #   _hashes[g] is the structural hash of this Block after the symmetry g
+    #   is applied to it, or None if it has not been computed. Symmetries 0 to
+    #   3 are 0 to 3 clockwise quarter turns, and symmetries 4 to 7 are a
+    #   left-right reflection followed by 0 to 3 clockwise quarter turns.
+    #   _hashes is None if none of them have been computed since the last
+    #   change.
+    # _stats:
+    #   The numbers of unit cells of each colour in this Block, on each of its
+    #   edges, and the width of its widest leaf of each colour, as described
+    #   in _subtree_stats, or None if they have to be computed again.
+    # _parent:
+    #   The Block whose _hashes, _stats or grid were last computed from this
+    #   Block's, or None.
+    # _grid_dirty:
+    #   0 if the square of this Block in the grid of its board is up to date,
+    #   1 if only the squares of some of its descendants have to be painted
+    #   again, and 2 if its whole square has to be painted again.
+    # _grid:
+    #   The unit cells of this board, kept between calls to colour_grid(), or
+    #   None. Only a Block at level 0 keeps its grid.
+    #
+    # Rotations and swaps only record what has to happen to the children and
+    # mark this Block as stale, so that they take constant time at any depth.
+    # The children are brought up to date one level at a time, the next time
+    # they are read through <children>. A Block that is reached by going
+    # through <children> from the root therefore always has a correct
+    # <position>, but a reference to a descendant that was kept from before an
+    # ancestor was rotated or swapped has to be looked up again.
+    #
+    # Copies made with create_copy(shared=True) share their subtrees with the
+    # original board and freeze them. A Block clones each frozen child the
+    # first time that child is read through <children>, so only the path down
+    # to a Block that is about to be changed is ever copied. Reading a board
+    # without changing it, with leaves(), never clones anything. As above,
+    # references to descendants that were kept from before the copy was made
+    # have to be looked up again.
+    #
+    # The structural hash of every Block is cached, together with the hashes
+    # of its rotations and reflections, so that a rotation only has to shift
+    # the cached hashes instead of changing every descendant. Every change to
+    # a Block clears the cached hashes of the Block and of its ancestors,
+    # stopping at the first ancestor whose hashes are already cleared, so a
+    # move only costs the hashes along one path of the tree to be computed
+    # again. The colour statistics of every Block are cached the same way, and
+    # the grid of a board is kept up to date the same way too: a change marks
+    # the squares along one path as dirty, and colour_grid() only paints the
+    # dirty squares again.
     position: Tuple[int, int]
     size: int
-    colour: Optional[Tuple[int, int, int]]
+    _colour: Optional[Tuple[int, int, int]]
     level: int
     max_depth: int
-    children: List[Block]
+    _children: List[Block]
+    _turns: int
+    _frame: int
+    _stale: bool
+    _frozen: bool
+    _hashes: Optional[List[Optional[int]]]
+    _stats: Optional[Tuple[List[int], List[List[int]], List[int]]]
+    _parent: Optional[Block]
+    _grid_dirty: int
+    _grid: Optional[ColourGrid]
 
     def __init__(self, position: Tuple[int, int], size: int,
                  colour: Optional[Tuple[int, int, int]], level: int,
@@ -113,10 +272,509 @@ class Block:
         """
         self.position = position
         self.size = size
-        self.colour = colour
+        self._colour = colour
         self.level = level
         self.max_depth = max_depth
-        self.children = []
+        self._children = []
+        self._turns = 0
+        self._frame = 0
+        self._stale = False
+        self._frozen = False
+        self._hashes = None
+        self._stats = None
+        self._parent = None
+        self._grid_dirty = 2
+        self._grid = None
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block if it is not subdivided, or None.
+        """
+        return self._colour
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        """Change the colour of this block to <colour>.
+        """
+        self._colour = colour
+        self._changed()
+
+    @property
+    def children(self) -> List[Block]:
+        """The blocks into which this block is subdivided, in the order
+        upper-right, upper-left, lower-left, lower-right.
+        """
+        children = self._children
+        for i in range(len(children)):
+            if children[i]._frozen:
+                children[i] = children[i]._thaw()
+                children[i]._parent = self
+
+        if self._stale:
+            self._resolve()
+        return self._children
+
+    @children.setter
+    def children(self, children: List[Block]) -> None:
+        """Replace the children of this block with <children>.
+        """
+        self._children = children
+        self._turns = 0
+        self._stale = True
+        self._changed()
+
+    def _changed(self) -> None:
+        """Clear the cached hashes and statistics of this Block and of its
+        ancestors, and mark its square of the grid as dirty.
+        """
+        self._hashes = None
+        self._stats = None
+        self._grid_dirty = 2
+        self._changed_above()
+
+    def _changed_above(self) -> None:
+        """Clear the cached hashes and statistics of the ancestors of this
+        Block and mark them as having a dirty descendant, after a change to
+        this Block that its own caches already account for.
+        """
+        block = self._parent
+        while block is not None and \
+                (block._hashes is not None or block._stats is not None or
+                 block._grid_dirty == 0):
+            block._hashes = None
+            block._stats = None
+            block._grid_dirty = max(block._grid_dirty, 1)
+            block = block._parent
+
+    def _resolve(self) -> None:
+        """Apply the pending rotation of this Block to its children, and give
+        its children positions consistent with this Block's.
+
+        Only the children are updated: each child that has children of its
+        own is marked as stale in turn.
+        """
+        turns = self._turns
+        if turns != 0 and len(self._children) != 0:
+            raw = self._children
+            self._children = [raw[(i + turns) % 4] for i in range(4)]
+
+        positions = self._children_positions()
+        for i in range(len(self._children)):
+            child = self._children[i]
+            child.position = positions[i]
+            child._frame = (child._frame + turns) % 4
+            if len(child._children) != 0:
+                child._turns = (child._turns + turns) % 4
+                child._stale = True
+                child._hashes = _turn_hashes(child._hashes, turns)
+                child._stats = _turn_stats(child._stats, turns)
+
+        self._turns = 0
+        self._stale = False
+
+    def _thaw(self) -> Block:
+        """Return a Block that can be changed and has the same contents as
+        this frozen Block.
+
+        Only this Block is cloned: the clone shares its children with this
+        Block, so they are frozen.
+        """
+        block = Block(self.position, self.size, self.colour, self.level,
+                      self.max_depth)
+        block._children = list(self._children)
+        block._turns = self._turns
+        block._frame = self._frame
+        block._stale = self._stale
+        block._hashes = _copy_hashes(self._hashes)
+        block._stats = self._stats
+        block._grid_dirty = self._grid_dirty
+
+        for child in block._children:
+            child._frozen = True
+
+        return block
+
+    def _restore(self, colour: Optional[Tuple[int, int, int]],
+                 children: List[Block], frame: int,
+                 colours: Optional[List[Tuple[int, int, int]]] = None) -> None:
+        """Give this Block <colour> and <children> again, as they were before a
+        smash or a combine, when the _frame of this Block was <frame>.
+
+        <colours> are the colours of <children>, which a LinearBlock needs
+        since it does not keep the children it combined. A Block keeps them,
+        so it ignores <colours>.
+
+        The turns this Block has been given by its ancestors since then are
+        taken back off <children>, since the ancestors still have to push the
+        turns that undo them down to this Block.
+        """
+        self._colour = colour
+        self._children = children
+        self._turns = (self._frame - frame) % 4 if len(children) != 0 else 0
+        self._stale = True
+        self._changed()
+
+    def structural_hash(self) -> int:
+        """Return a 64-bit hash of the colours, levels and arrangement of the
+        blocks within this Block.
+
+        Blocks that are equal have the same hash, and blocks with different
+        hashes are not equal. Only the hashes that were cleared by the moves
+        made since the last call are computed again.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.structural_hash() == leaf_key(0, COLOUR_LIST[0])
+        True
+        """
+        return self._symmetry_hash(0)
+
+    def symmetry_hash(self, symmetry: int) -> int:
+        """Return the structural hash of this Block after <symmetry> is applied
+        to it.
+
+        Symmetries 0 to 3 are 0 to 3 clockwise quarter turns, and symmetries 4
+        to 7 are a left-right reflection followed by 0 to 3 clockwise quarter
+        turns. A rotation leaves this Block unchanged iff the hash of the
+        symmetry for that rotation is the same as symmetry_hash(0).
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.symmetry_hash(1) == block.structural_hash()
+        True
+        """
+        return self._symmetry_hash(symmetry)
+
+    def canonical_key(self) -> int:
+        """Return the smallest structural hash of the eight boards that this
+        Block can be turned into by rotating and reflecting it.
+
+        Boards that are rotations or reflections of each other have the same
+        canonical key, and every goal scores them the same. The eight hashes
+        are cached, so this takes constant time for a board that has not
+        changed since the last call.
+
+        ScoreCache and the searches of the players key boards on
+        structural_hash() instead: after a move, a canonical key needs all
+        eight hashes along the changed path, against one for structural_hash(),
+        which costs more than the scores that boards related by symmetry save.
+
+        >>> block = generate_board(3, 750)
+        >>> turned = block.create_copy()
+        >>> turned.rotate(1)
+        True
+        >>> turned.canonical_key() == block.canonical_key()
+        True
+        """
+        return min(self._symmetry_hashes())
+
+    def canonical_form(self) -> Block:
+        """Return a new Block that is a deep copy of this Block, rotated and
+        reflected so that its structural hash is its canonical key.
+
+        >>> block = generate_board(3, 750)
+        >>> canonical = block.canonical_form()
+        >>> canonical.structural_hash() == block.canonical_key()
+        True
+        >>> canonical.canonical_form() == canonical
+        True
+        """
+        hashes = self._symmetry_hashes()
+        return self._transformed_copy(hashes.index(min(hashes)))
+
+    def _transformed_copy(self, symmetry: int) -> Block:
+        """Return a new Block that is a deep copy of this Block after
+        <symmetry> is applied to it.
+
+        The positions of the descendants of the copy are brought up to date
+        when they are read through <children>.
+        """
+        block = Block(self.position, self.size, self._colour, self.level,
+                      self.max_depth)
+        if len(self._children) == 0:
+            return block
+
+        symmetry = _compose(symmetry, self._turns)
+        children = []
+        for i in range(4):
+            child = self._children[_source_index(symmetry, i)]
+            children.append(child._transformed_copy(symmetry))
+
+        block.children = children
+        return block
+
+    def _symmetry_hashes(self) -> Tuple[int, ...]:
+        """Return the structural hashes of this Block after each of the
+        eight symmetries is applied to it, computing them if they are not
+        cached.
+        """
+        return tuple(self._symmetry_hash(symmetry) for symmetry in range(8))
+
+    def _symmetry_hash(self, symmetry: int) -> int:
+        """Return the structural hash of this Block after <symmetry> is applied
+        to it, computing it if it is not cached.
+
+        Only the hashes of the descendants that this one is computed from are
+        computed, so that scoring a board after a move, which only needs
+        structural_hash(), does not compute all eight for every block above
+        the move.
+        """
+        if self._hashes is None:
+            if len(self._children) == 0:
+                self._hashes = [leaf_key(self.level, self._colour)] * 8
+                return self._hashes[symmetry]
+            self._hashes = [None] * 8
+        elif self._hashes[symmetry] is not None:
+            return self._hashes[symmetry]
+
+        # the pending turns of this Block are applied before <symmetry>
+        combined = _compose(symmetry, self._turns)
+        keys = []
+        for i in range(4):
+            child = self._children[_source_index(combined, i)]
+            child._parent = self
+            keys.append(child._symmetry_hash(combined))
+
+        self._hashes[symmetry] = parent_key(self.level, keys)
+        return self._hashes[symmetry]
+
+    def colour_counts(self) -> List[int]:
+        """Return the number of unit cells of each colour in this Block, in the
+        order of COLOUR_LIST.
+
+        Only the statistics that were cleared by the moves made since the last
+        call are computed again, so this takes constant time for a board that
+        has not changed.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> block.colour_counts()
+        [0, 4, 0, 0]
+        """
+        return list(self._subtree_stats()[0])
+
+    def edge_counts(self) -> List[int]:
+        """Return the number of unit cells of each colour on the edges of this
+        Block, in the order of COLOUR_LIST, with the cells in the corners
+        counted once for each edge they are on.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> block.edge_counts()
+        [0, 8, 0, 0]
+        """
+        edges = self._subtree_stats()[1]
+        return [edges[0][i] + edges[1][i] + edges[2][i] + edges[3][i]
+                for i in range(len(COLOUR_LIST))]
+
+    def leaf_widths(self) -> List[int]:
+        """Return the width in unit cells of the widest undivided Block of each
+        colour within this Block, in the order of COLOUR_LIST, or 0 for a
+        colour with no undivided Block.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> block.leaf_widths()
+        [0, 2, 0, 0]
+        """
+        return list(self._subtree_stats()[2])
+
+    def _subtree_stats(self) -> Tuple[List[int], List[List[int]], List[int]]:
+        """Return the colour statistics of this Block, computing them if they
+        are not cached.
+
+        The statistics are three lists. The first one holds the number of unit
+        cells of each colour in this Block. The second one holds, for the top,
+        right, bottom and left edges of this Block in that order, the number
+        of unit cells of each colour on that edge. The third one holds the
+        width of the widest leaf of each colour. Colours are in the order of
+        COLOUR_LIST, and the lists must not be modified.
+        """
+        if self._stats is not None:
+            return self._stats
+
+        if len(self._children) == 0:
+            width = 2 ** (self.max_depth - self.level)
+            counts = [0] * len(COLOUR_LIST)
+            counts[COLOUR_LIST.index(self._colour)] = width * width
+            edge = [0] * len(COLOUR_LIST)
+            edge[COLOUR_LIST.index(self._colour)] = width
+            widths = [0] * len(COLOUR_LIST)
+            widths[COLOUR_LIST.index(self._colour)] = width
+            self._stats = (counts, [edge, edge, edge, edge], widths)
+            return self._stats
+
+        children = []
+        for i in range(4):
+            child = self._children[(i + self._turns) % 4]
+            child._parent = self
+            children.append(_turn_stats(child._subtree_stats(), self._turns))
+        upper_right, upper_left, lower_left, lower_right = children
+
+        counts = [upper_right[0][i] + upper_left[0][i] + lower_left[0][i] +
+                  lower_right[0][i] for i in range(len(COLOUR_LIST))]
+        edges = []
+        for side, first, second in [(0, upper_left, upper_right),
+                                    (1, upper_right, lower_right),
+                                    (2, lower_left, lower_right),
+                                    (3, upper_left, lower_left)]:
+            edges.append([first[1][side][i] + second[1][side][i]
+                          for i in range(len(COLOUR_LIST))])
+        widths = [max(upper_right[2][i], upper_left[2][i], lower_left[2][i],
+                      lower_right[2][i]) for i in range(len(COLOUR_LIST))]
+
+        self._stats = (counts, edges, widths)
+        return self._stats
+
+    def leaves(self, boundary: bool = False) -> \
+            List[Tuple[Tuple[int, int, int], Tuple[int, int], int, int, int,
+                       int]]:
+        """Return a list of tuples describing every undivided Block within this
+        Block, without changing or copying any of them.
+
+        If <boundary> is True, only the undivided Blocks that touch an edge of
+        this Block are described, and the blocks that do not touch an edge are
+        never visited.
+
+        Each tuple contains:
+        - the colour of the leaf,
+        - the (x, y) coordinates of the top left corner of the leaf,
+        - the size of the leaf,
+        - the column and the row of the top left unit cell of the leaf,
+          relative to the top left unit cell of this Block,
+        - the width of the leaf in unit cells,
+        in that order.
+
+        The order of the tuples does not matter.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.leaves()
+        [((1, 128, 181), (0, 0), 750, 0, 0, 2)]
+        """
+        result = []
+        last = 2 ** (self.max_depth - self.level)
+        # the pending rotations of the ancestors of a Block in <pending> that
+        # have not been pushed down to it yet are carried along with it
+        pending = [(self, self.position, 0, 0, 0)]
+        while len(pending) != 0:
+            block, position, column, row, turns = pending.pop()
+            width = 2 ** (block.max_depth - block.level)
+
+            if len(block._children) == 0:
+                result.append((block.colour, position, block.size, column,
+                               row, width))
+                continue
+
+            turns = (turns + block._turns) % 4
+            x = position[0]
+            y = position[1]
+            size = block._child_size()
+            half = width // 2
+            positions = [((x + size, y), column + half, row),
+                         ((x, y), column, row),
+                         ((x, y + size), column, row + half),
+                         ((x + size, y + size), column + half, row + half)]
+            for i in range(4):
+                child = block._children[(i + turns) % 4]
+                child_position, child_column, child_row = positions[i]
+                if boundary and 0 < child_column < last - half and \
+                        0 < child_row < last - half:
+                    continue
+                pending.append((child, child_position, child_column,
+                                child_row, turns))
+
+        return result
+
+    def colour_grid(self) -> np.ndarray:
+        """Return a two-dimensional uint8 array representing this Block as
+        columns and rows of unit cells.
+
+        Element [i, j] is the index in COLOUR_LIST of the colour of the unit
+        cell at column i and row j, and [0, 0] is the unit cell in the upper
+        left corner of this Block.
+
+        A board, at level 0, keeps its grid between calls, and only paints
+        again the squares of the blocks that were changed since the last call.
+        The grid that is returned must not be modified.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[2], 0, 1)
+        >>> block.colour_grid().tolist()
+        [[2, 2], [2, 2]]
+        """
+        if self.level == 0:
+            return self.board_grid().cells
+
+        unit_num = 2 ** (self.max_depth - self.level)
+        grid = np.empty((unit_num, unit_num), dtype=np.uint8)
+        for colour, _, _, column, row, width in self.leaves():
+            grid[column:column + width, row:row + width] = \
+                COLOUR_LIST.index(colour)
+        return grid
+
+    def board_grid(self) -> ColourGrid:
+        """Return the ColourGrid of this board, brought up to date.
+
+        Precondition: self.level == 0
+        """
+        if self._grid is None:
+            unit_num = 2 ** self.max_depth
+            self._grid = ColourGrid(np.empty((unit_num, unit_num),
+                                             dtype=np.uint8))
+            self._grid_dirty = 2
+        elif self._grid_dirty != 0:
+            # a grid shared with a copy of this board is copied before it is
+            # painted
+            self._grid = self._grid.unshare()
+        self._refresh_grid(self._grid, 0, 0, 0)
+        return self._grid
+
+    def _refresh_grid(self, grid: ColourGrid, column: int, row: int,
+                      turns: int) -> None:
+        """Paint again the dirty squares within this Block in <grid>, where the
+        top left unit cell of this Block is at <column> and <row>.
+
+        <turns> is the number of clockwise quarter turns that the ancestors of
+        this Block have not pushed down to it yet.
+        """
+        if self._grid_dirty == 0:
+            return
+        if self._grid_dirty == 2 or len(self._children) == 0:
+            self._paint_grid(grid, column, row, turns)
+            return
+
+        turns = (turns + self._turns) % 4
+        half = 2 ** (self.max_depth - self.level - 1)
+        offsets = [(half, 0), (0, 0), (0, half), (half, half)]
+        for i in range(4):
+            child = self._children[(i + turns) % 4]
+            child._parent = self
+            child._refresh_grid(grid, column + offsets[i][0],
+                                row + offsets[i][1], turns)
+        self._grid_dirty = 0
+
+    def _paint_grid(self, grid: ColourGrid, column: int, row: int,
+                    turns: int) -> None:
+        """Paint the whole square of this Block in <grid>, and mark it and its
+        descendants as up to date.
+
+        <column>, <row> and <turns> are as in _refresh_grid.
+        """
+        grid.record(column, row, 2 ** (self.max_depth - self.level))
+        cells = grid.cells
+        pending = [(self, column, row, turns)]
+        while len(pending) != 0:
+            block, column, row, turns = pending.pop()
+            block._grid_dirty = 0
+            width = 2 ** (block.max_depth - block.level)
+
+            if len(block._children) == 0:
+                cells[column:column + width, row:row + width] = \
+                    COLOUR_LIST.index(block._colour)
+                continue
+
+            turns = (turns + block._turns) % 4
+            half = width // 2
+            offsets = [(half, 0), (0, 0), (0, half), (half, half)]
+            for i in range(4):
+                child = block._children[(i + turns) % 4]
+                child._parent = block
+                pending.append((child, column + offsets[i][0],
+                                row + offsets[i][1], turns))
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -144,6 +802,10 @@ class Block:
         """Return True iff this Block and all its descendents are equivalent to
         the <other> Block and all its descendents.
         """
+        if isinstance(other, Block) and \
+                self.structural_hash() != other.structural_hash():
+            return False
+
         if len(self.children) == 0 and len(other.children) == 0:
             # Both self and other are leaves.
             return self.position == other.position and \
@@ -180,25 +842,6 @@ class Block:
 
         return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
 
-    def _update_children_positions(self, position: Tuple[int, int]) -> None:
-        """Set the position of this Block to <position> and update all its
-        descendants to have positions consistent with this Block's.
-
-        <position> is the (x, y) coordinates of the upper-left corner of this
-        Block.
-        """
-        # set the position of this block to <position>
-        self.position = position
-
-        # change the position of its children
-        if len(self.children) != 0:
-            for i in range(4):
-                self.children[i].position = self._children_positions()[i]
-
-        # change the position of its descendants
-        for child in self.children:
-            child._update_children_positions(child.position)
-
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
 
@@ -283,8 +926,9 @@ class Block:
         else:
             self.children = [child[1], child[0], child[3], child[2]]
 
-        # does all descendants need to be swapped?
-        self._update_children_positions(self.position)
+        # the positions of the children are updated lazily
+        self._stale = True
+        self._changed()
 
         return True
 
@@ -298,22 +942,17 @@ class Block:
 
         Precondition: <direction> is either 1 or 3.
         """
-        if len(self.children) == 0:
+        if len(self._children) == 0:
             return False
 
-        child = self.children
-
-        # rotate clockwise
-        if direction == 1:
-            self.children = [child[1], child[2], child[3], child[0]]
-        # rotate counterclockwise
-        else:
-            self.children = [child[3], child[0], child[1], child[2]]
-
-        self._update_children_positions(self.position)
-
-        for child in self.children:
-            child.rotate(direction)
+        # record the rotation; it is pushed down to the children, one level at
+        # a time, only when they are read
+        self._turns = (self._turns + direction) % 4
+        self._stale = True
+        self._hashes = _turn_hashes(self._hashes, direction)
+        self._stats = _turn_stats(self._stats, direction)
+        self._grid_dirty = 2
+        self._changed_above()
 
         return True
 
@@ -348,40 +987,53 @@ class Block:
         if len(self.children) == 0 or self.level != self.max_depth - 1:
             return False
 
-        # collect the colours
-        colours = {}
-
-        for child in self.children:
-            child_colour = child.colour
-            if child_colour not in colours:
-                colours[child_colour] = 0
-            colours[child_colour] += 1
-
-        # find the major colour
-        highest_count = 0
-        major_colour = (0, 0, 0)
-        for colour in colours:
-            if colours[colour] > highest_count:
-                highest_count = colours[colour]
-                major_colour = colour
+        # the children are unit cells, so the colour counts of this Block are
+        # the numbers of children of each colour
+        counts = self.colour_counts()
+        highest_count = max(counts)
+        major_colour = COLOUR_LIST[counts.index(highest_count)]
 
         # check to make sure there is no tie situation
-        for colour in colours:
-            if colour != major_colour and colours[colour] == highest_count:
-                return False
+        if counts.count(highest_count) > 1:
+            return False
 
         self.children = []
         self.colour = major_colour
         return True
 
-    def create_copy(self) -> Block:
+    def create_copy(self, shared: bool = False) -> Block:
         """Return a new Block that is a deep copy of this Block.
 
         Remember that a deep copy has new blocks (not aliases) at every level.
+
+        If <shared> is True, the copy shares all of its descendants with this
+        Block instead, and each of the two only clones the blocks it goes on to
+        change. The copy shares the grid of this board too, until one of them
+        paints it. This takes constant time, besides bringing the grid of this
+        board up to date if it has one, but any reference to a descendant of
+        this Block that was kept from before the copy must be looked up again
+        through <children> before it is changed.
         """
         block = Block(self.position, self.size, self.colour, self.level,
                       self.max_depth)
 
+        if shared:
+            if self._grid is not None:
+                # the grids of both boards rely on the dirty marks of the
+                # blocks they share, so none of them may be dirty
+                block._grid = self.board_grid().share()
+            block._children = list(self._children)
+            block._turns = self._turns
+            block._stale = self._stale
+            block._hashes = _copy_hashes(self._hashes)
+            block._stats = self._stats
+            block._grid_dirty = self._grid_dirty
+
+            for child in self._children:
+                child._frozen = True
+
+            return block
+
         if len(self.children) == 0:
             return block
         else:
@@ -394,13 +1046,292 @@ class Block:
             return block
 
 
+def _turn_stats(stats: Optional[Tuple[List[int], List[List[int]],
+                                      List[int]]],
+                turns: int) -> Optional[Tuple[List[int], List[List[int]],
+                                              List[int]]]:
+    """Return the colour statistics of a Block whose statistics were <stats>,
+    after it is turned clockwise <turns> more times.
+
+    >>> _turn_stats(([1], [[1], [2], [3], [4]], [1]), 1)
+    ([1], [[4], [1], [2], [3]], [1])
+    """
+    if stats is None or turns == 0:
+        return stats
+    edges = stats[1]
+    return stats[0], [edges[(side - turns) % 4] for side in range(4)], stats[2]
+
+
+class ColourGrid:
+    """The unit cells of a board, together with a record of the squares of
+    them that were painted most recently.
+
+    A board keeps its ColourGrid up to date, so that anything computed from
+    the cells can be brought up to date by looking at the squares that were
+    painted since it was computed, instead of at the whole board.
+
+    === Public Attributes ===
+    cells:
+        cells[i, j] is the index in COLOUR_LIST of the colour of the unit cell
+        at column i and row j.
+    version:
+        The number of times a square of <cells> has been painted.
+
+    === Representation Invariants ===
+    - len(_log) <= version
+    - _sharers >= 0
+    """
+    # === Private Attributes ===
+    # _log:
+    #   The squares that were painted most recently, oldest first, each given
+    #   by the column and the row of its top left unit cell and its width. The
+    #   last one is the one painted at <version>.
+    # _sharers:
+    #   The number of boards that use this ColourGrid besides the first one.
+    #   A board that is given up without painting the grid is still counted,
+    #   which only costs one copy that was not needed.
+    cells: np.ndarray
+    version: int
+    _log: List[Tuple[int, int, int]]
+    _sharers: int
+
+    def __init__(self, cells: np.ndarray) -> None:
+        """Initialize a ColourGrid with <cells> and no squares painted yet.
+        """
+        self.cells = cells
+        self.version = 0
+        self._log = []
+        self._sharers = 0
+
+    def share(self) -> ColourGrid:
+        """Return this ColourGrid, for one more board to use.
+        """
+        self._sharers += 1
+        return self
+
+    def unshare(self) -> ColourGrid:
+        """Return a ColourGrid with the same cells and record as this one, that
+        a board which used this one can paint without changing the others.
+
+        This ColourGrid is returned if no other board uses it.
+
+        >>> grid = ColourGrid(np.zeros((2, 2), dtype=np.uint8))
+        >>> grid.share().unshare() is grid
+        False
+        >>> grid.unshare() is grid
+        True
+        """
+        if self._sharers == 0:
+            return self
+
+        self._sharers -= 1
+        grid = ColourGrid(self.cells.copy())
+        grid.version = self.version
+        grid._log = list(self._log)
+        return grid
+
+    def record(self, column: int, row: int, width: int) -> None:
+        """Record that the square of <width> unit cells whose top left unit
+        cell is at <column> and <row> is being painted.
+        """
+        if len(self._log) >= _GRID_LOG_LIMIT:
+            del self._log[:_GRID_LOG_LIMIT // 2]
+        self._log.append((column, row, width))
+        self.version += 1
+
+    def painted_since(self, version: int) -> \
+            Optional[List[Tuple[int, int, int]]]:
+        """Return the squares painted since the cells were at <version>, in the
+        same format as _log, or None if they are no longer recorded.
+
+        >>> grid = ColourGrid(np.zeros((4, 4), dtype=np.uint8))
+        >>> grid.record(0, 0, 2)
+        >>> grid.record(2, 2, 1)
+        >>> grid.painted_since(1)
+        [(2, 2, 1)]
+        """
+        count = self.version - version
+        if count > len(self._log):
+            return None
+        return self._log[len(self._log) - count:]
+
+
+def _compose(symmetry: int, turns: int) -> int:
+    """Return the symmetry that has the same effect as <turns> clockwise
+    quarter turns followed by <symmetry>.
+
+    >>> _compose(1, 2)
+    3
+    >>> _compose(5, 1)
+    4
+    """
+    if symmetry < 4:
+        return (symmetry + turns) % 4
+    # a reflection turns the other way
+    return 4 + (symmetry - turns) % 4
+
+
+def _source_index(symmetry: int, index: int) -> int:
+    """Return the index of the child that ends up at <index> when <symmetry>
+    is applied to a Block.
+    """
+    if symmetry < 4:
+        return (index + symmetry) % 4
+    return (1 - index - symmetry) % 4
+
+
+def _turn_hashes(hashes: Optional[List[Optional[int]]], turns: int) -> \
+        Optional[List[Optional[int]]]:
+    """Return the symmetry hashes of a Block whose symmetry hashes were
+    <hashes>, after it is turned clockwise <turns> more times.
+    """
+    if hashes is None or turns == 0:
+        return hashes
+    return [hashes[_compose(symmetry, turns)] for symmetry in range(8)]
+
+
+def _copy_hashes(hashes: Optional[List[Optional[int]]]) -> \
+        Optional[List[Optional[int]]]:
+    """Return a copy of the symmetry hashes <hashes> of a Block, for a copy of
+    that Block, which fills in the hashes it computes separately.
+    """
+    if hashes is None:
+        return None
+    return list(hashes)
+
+
+class MoveJournal:
+    """A record of the moves made on a board, so that they can be undone.
+
+    Each move is made through one of the methods of this class, which make the
+    move on the given Block exactly like the Block method of the same name, and
+    remember how to undo it if it was performed. A savepoint marks a point in
+    the record that the board can later be rolled back to, which makes it
+    possible to try a move on a board, score it and undo it without copying the
+    board.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+    >>> journal = MoveJournal()
+    >>> start = journal.savepoint()
+    >>> journal.smash(board)
+    True
+    >>> len(board.children)
+    4
+    >>> journal.rollback(start)
+    >>> len(board.children) == 0 and board.colour == COLOUR_LIST[0]
+    True
+    """
+    # === Private Attributes ===
+    # _undo:
+    #   The moves made through this journal that have not been undone yet,
+    #   oldest first. Each one is stored as the Block it was made on, the name
+    #   of the move, and the data needed to undo it.
+    _undo: List[Tuple[Block, str, object]]
+
+    def __init__(self) -> None:
+        """Initialize an empty journal.
+        """
+        self._undo = []
+
+    def __len__(self) -> int:
+        """Return the number of moves that can be undone.
+        """
+        return len(self._undo)
+
+    def savepoint(self) -> int:
+        """Return a savepoint for the current state of the board, to be passed
+        to rollback.
+        """
+        return len(self._undo)
+
+    def rollback(self, savepoint: int = 0) -> None:
+        """Undo every move made since <savepoint>, most recent first.
+
+        The board must not have been copied with create_copy(shared=True)
+        since <savepoint>, and every move must have been made on a Block that
+        was looked up through <children> just before.
+        """
+        while len(self._undo) > savepoint:
+            block, move, data = self._undo.pop()
+            if move == 'rotate':
+                block.rotate(4 - data)
+            elif move == 'swap':
+                # the ancestors of <block> may not have pushed the turns that
+                # undo later rotations down to it yet; a swap seen a quarter
+                # turn away is the other swap
+                direction, frame = data
+                if (block._frame - frame) % 2 == 1:
+                    direction = 1 - direction
+                block.swap(direction)
+            elif move == 'paint':
+                block.colour = data
+            elif move == 'smash':
+                block._restore(data, [], 0)
+            else:
+                # undo a combine
+                block._restore(None, data[0], data[1], data[2])
+
+    def smash(self, block: Block) -> bool:
+        """Smash <block> and return True iff the smash was performed.
+        """
+        colour = block.colour
+        if not block.smash():
+            return False
+
+        self._undo.append((block, 'smash', colour))
+        return True
+
+    def combine(self, block: Block) -> bool:
+        """Combine <block> and return True iff it was turned into a leaf.
+        """
+        children = block.children
+        colours = [child.colour for child in children]
+        if not block.combine():
+            return False
+
+        self._undo.append((block, 'combine',
+                           (children, block._frame, colours)))
+        return True
+
+    def paint(self, block: Block, colour: Tuple[int, int, int]) -> bool:
+        """Paint <block> with <colour> and return True iff its colour was
+        changed.
+        """
+        old_colour = block.colour
+        if not block.paint(colour):
+            return False
+
+        self._undo.append((block, 'paint', old_colour))
+        return True
+
+    def rotate(self, block: Block, direction: int) -> bool:
+        """Rotate <block> in <direction> and return True iff the rotate was
+        performed.
+        """
+        if not block.rotate(direction):
+            return False
+
+        self._undo.append((block, 'rotate', direction))
+        return True
+
+    def swap(self, block: Block, direction: int) -> bool:
+        """Swap the children of <block> in <direction> and return True iff the
+        swap was performed.
+        """
+        if not block.swap(direction):
+            return False
+
+        self._undo.append((block, 'swap', (direction, block._frame)))
+        return True
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
-            'settings'
+            'settings', 'linear_block', 'zobrist', 'numpy', 'struct'
         ],
         'max-attributes': 15,
         'max-args': 6
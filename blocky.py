@@ -23,15 +23,15 @@ This file contains the different game states for the Blocky game.
 """
 
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, Tuple
 import pygame
 
-from actions import ACTION_MESSAGE, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,\
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
+from actions import ACTION_MESSAGE
 from block import Block
-from player import Player
+from player import Player, BackgroundMove
 from renderer import Renderer
 from settings import ANIMATION_DURATION
+from simulation import GameData
 
 
 def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
@@ -48,76 +48,10 @@ def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
 
     The order of the squares does not matter.
     """
-    if len(board.children) == 0:
-        return [(board.colour, board.position, board.size)]
-    else:
-        squares = []
-        for child in board.children:
-            squares.extend(_block_to_squares(child))
-        return squares
-
-
-class GameData:
-    """
-    A bundle of the data needed for a Blocky game.
-
-    === Public Attributes ===
-    max_turns:
-        The maximum number of turns for the game.
-    board:
-        The Blocky board on which this game will be played.
-    players:
-        The entities that are playing this game.
-    smashes:
-        The number of smashes done by each player.
-    combines:
-        The number of combines done by each player.
-    paints:
-        The number of paints done by each player.
-
-    === Representation Invariants ===
-    - len(players) >= 1
-    """
-    max_turns: int
-    board: Block
-    players: List[Player]
-    smashes: Dict[int, int]
-    combines: Dict[int, int]
-    paints: Dict[int, int]
-
-    def __init__(self, board: Block, players: List[Player]) -> None:
-        """Initialize the game data, saving a reference to <board> and
-        <players>.
-
-        Precondition:
-            - len(players) >= 1
-        """
-        self.max_turns = 0
-        self.board = board
-        self.players = players
-
-        self.smashes = {}
-        self.combines = {}
-        self.paints = {}
-
-        # Start off all counts at 0
-        for player in players:
-            self.smashes[player.id] = 0
-            self.combines[player.id] = 0
-            self.paints[player.id] = 0
-
-    def calculate_score(self, player_id: int) -> Tuple[int, int]:
-        """Return a tuple containing first the <player_id>'s score based on
-        their goal in the game and second the deductions from their score based
-        on the actions they've taken.
-        """
-        goal_score = self.players[player_id].goal.score(self.board)
-
-        penalty = (self.smashes[player_id] * ACTION_PENALTY[SMASH] +
-                   self.combines[player_id] * ACTION_PENALTY[COMBINE] +
-                   self.paints[player_id] * ACTION_PENALTY[PAINT])
-
-        return goal_score, penalty
+    squares = []
+    for colour, position, size, _, _, _ in board.leaves():
+        squares.append((colour, position, size))
+    return squares
 
 
 class GameState:
@@ -141,6 +75,14 @@ class GameState:
         """
         raise NotImplementedError
 
+    def close(self) -> None:
+        """Stop anything this GameState is doing in the background, because
+        the game is being closed.
+
+        By default, there is nothing to stop.
+        """
+        return
+
 
 class MainState(GameState):
     """A GameState that manages the moves made by different players in Blocky.
@@ -154,10 +96,14 @@ class MainState(GameState):
     #   The index of the current player in GameData.players.
     # _current_score:
     #   The score of the current player, including penalties.
+    # _pending:
+    #   The move the current player is generating in the background, or None
+    #   if it is not generating one.
     _turn: int
     _data: GameData
     _current_player_index: int
     _current_score: int
+    _pending: Optional[BackgroundMove]
 
     def __init__(self, data: GameData) -> None:
         """Initialize this GameState.
@@ -165,6 +111,7 @@ class MainState(GameState):
         self._turn = 0
         self._data = data
         self._current_player_index = 0
+        self._pending = None
 
         score, penalty = self._data.calculate_score(self._current_player().id)
         self._current_score = score - penalty
@@ -189,28 +136,7 @@ class MainState(GameState):
     def _do_move(self, move: Tuple[str, Optional[int], Block]) -> bool:
         """Attempt to do the player's requested move.
         """
-        action = (move[0], move[1])
-        direction = move[1]
-        block = move[2]
-        player = self._current_player()
-        move_successful = False
-
-        if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
-            move_successful = block.rotate(direction)
-        elif action in [SWAP_HORIZONTAL, SWAP_VERTICAL]:
-            move_successful = block.swap(direction)
-        elif action == SMASH:
-            move_successful = block.smash()
-            self._data.smashes[player.id] += int(move_successful)
-        elif action == PAINT:
-            move_successful = block.paint(self._current_player().goal.colour)
-            self._data.paints[player.id] += int(move_successful)
-        elif action == COMBINE:
-            move_successful = block.combine()
-            self._data.combines[player.id] += int(move_successful)
-        elif action == PASS:
-            # Do nothing
-            move_successful = True
+        move_successful = self._data.make_move(self._current_player(), move)
 
         if move_successful:
             self._update_player()
@@ -218,14 +144,31 @@ class MainState(GameState):
         return move_successful
 
     def process_event(self, event: pygame.event.Event) -> None:
+        if self._pending is not None:
+            return  # Ignore the event while the player is thinking
         self._current_player().process_event(event)
 
     def update(self) -> GameState:
         if self._turn >= self._data.max_turns:
             return GameOverState(self._data)
 
-        # Ask the player to make a move
-        move = self._current_player().generate_move(self._data.board)
+        player = self._current_player()
+        if self._pending is None:
+            player.turns_left = self._data.max_turns - self._turn
+            if player.is_ready() and player.thinks_in_background():
+                # a computer player may think for a long time, so its move is
+                # generated in the background while the game loop goes on
+                self._pending = BackgroundMove(player, self._data.board)
+
+        if self._pending is None:
+            # Ask the player to make a move
+            move = player.generate_move(self._data.board)
+        elif self._pending.done():
+            move = self._pending.result()
+            self._pending = None
+        else:
+            # The player is still thinking, stay in the current state
+            return self
 
         if move is None:
             # No move was made, stay in the current state
@@ -252,10 +195,19 @@ class MainState(GameState):
             renderer.highlight_block(b.position, b.size)
 
         p = self._current_player()
-        status = f'Turn {self._turn} | Player {p.id} | ' \
-                 f'Score {self._current_score} | {p.goal.description()}'
+        if self._pending is not None:
+            status = f'Turn {self._turn} | Player {p.id} is thinking...'
+        else:
+            status = f'Turn {self._turn} | Player {p.id} | ' \
+                     f'Score {self._current_score} | {p.goal.description()}'
         renderer.draw_status(status)
 
+    def close(self) -> None:
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self._data.close_players()
+
 
 class AnimateMoveState(GameState):
     """A GameState that animates a move made by a player before returning to its
@@ -335,12 +287,15 @@ class GameOverState(GameState):
         """Initialize this GameState.
         """
         self._scores = []
-        for p in data.players:
-            goal_score, penalty = data.calculate_score(p.id)
+        scores = data.calculate_scores()
+        for p, score in zip(data.players, scores):
+            goal_score, penalty = score
             self._scores.append((p.id, goal_score, penalty))
 
         self._winner = max(self._scores, key=lambda item: item[1] - item[2])[0]
 
+        data.close_players()
+
     def process_event(self, event: pygame.event.Event) -> None:
         # Simply ignore the event
         return
@@ -371,7 +326,7 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'block', 'player', 'renderer', 'settings', 'actions', 'simulation'
         ],
         'generated-members': 'pygame.*'
     })
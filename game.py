@@ -77,6 +77,7 @@ class Game:
             # Process events
             for e in pygame.event.get():
                 if e.type == pygame.QUIT:
+                    self._state.close()
                     return
                 else:
                     self._state.process_event(e)
@@ -22,11 +22,23 @@ Misha Schwartz, and Jaisie Sin
 This file contains the hierarchy of Goal classes.
 """
 from __future__ import annotations
+from collections import OrderedDict
+import heapq
 import math
 import random
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+import numpy as np
+
 from block import Block
-from settings import colour_name, COLOUR_LIST
+from settings import colour_name, COLOUR_LIST, SCORE_CACHE_SIZE
+
+# The most squares a BlobIndex brings itself up to date from before it labels
+# the whole board again instead.
+_BLOB_SQUARE_LIMIT = 64
+
+# The fewest unit cells a board has for a BlobIndex to bring itself up to date
+# from the squares painted on it. Labelling a smaller board again is faster.
+_BLOB_INCREMENTAL_CELLS = 4096
 
 
 def generate_goals(num_goals: int) -> List[Goal]:
@@ -58,6 +70,89 @@ def generate_goals(num_goals: int) -> List[Goal]:
     return goals
 
 
+def score_goals(board: Block, goals: List[Goal]) -> List[int]:
+    """Return the score of each goal in <goals> on <board>, in order.
+
+    The perimeter goals are all scored from one count of the colours of the
+    edge cells, which a Block keeps up to date itself. The board is flattened
+    at most once, and the blob goals are all scored from one pass over it
+    that finds the blobs of every colour. Any other kind of goal is scored on
+    its own.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+    >>> score_goals(board, [PerimeterGoal(COLOUR_LIST[1]),
+    ...                     BlobGoal(COLOUR_LIST[1]),
+    ...                     BlobGoal(COLOUR_LIST[0])])
+    [8, 4, 0]
+    """
+    grid = None
+    edge_counts = None
+    blobs = None
+
+    scores = []
+    for goal in goals:
+        if goal.colour not in COLOUR_LIST:
+            scores.append(0)
+        elif isinstance(goal, PerimeterGoal):
+            if edge_counts is None:
+                if isinstance(board, Block):
+                    edge_counts = board.edge_counts()
+                else:
+                    grid = _flatten_grid(board)
+                    edges = np.concatenate([grid[:, 0], grid[:, -1],
+                                            grid[0, :], grid[-1, :]])
+                    edge_counts = np.bincount(
+                        edges, minlength=len(COLOUR_LIST)).tolist()
+            scores.append(edge_counts[COLOUR_LIST.index(goal.colour)])
+        elif isinstance(goal, BlobGoal):
+            if blobs is None:
+                if grid is None:
+                    grid = _flatten_grid(board)
+                blobs = _largest_blobs(grid)
+            scores.append(blobs[COLOUR_LIST.index(goal.colour)])
+        else:
+            scores.append(goal.score(board))
+
+    return scores
+
+
+def _reachable_cells(board: Block, colour: Tuple[int, int, int],
+                     moves: int) -> int:
+    """Return a number that the unit cells of <colour> on <board> cannot
+    exceed after at most <moves> more moves.
+
+    Rotations and swaps do not change how many cells there are of each
+    colour. A paint adds at most one cell of <colour> and a combine at most
+    two, and a smash at most as many as the largest leaf that can be smashed
+    and is not of <colour>, since it colours the new blocks at random. A
+    Block keeps the numbers needed up to date itself, so this takes constant
+    time for a Block board that has not changed.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> _reachable_cells(board, COLOUR_LIST[1], 0)
+    0
+    >>> _reachable_cells(board, COLOUR_LIST[1], 1)
+    4
+    """
+    count = 0
+    gain = 2
+    if isinstance(board, Block):
+        target = COLOUR_LIST.index(colour)
+        count = board.colour_counts()[target]
+        widths = board.leaf_widths()
+        for i in range(len(COLOUR_LIST)):
+            if i != target and widths[i] > 1:
+                gain = max(gain, widths[i] * widths[i])
+    else:
+        for leaf_colour, _, _, _, _, width in board.leaves():
+            if leaf_colour == colour:
+                count += width * width
+            elif width > 1:
+                gain = max(gain, width * width)
+
+    return min(4 ** (board.max_depth - board.level), count + moves * gain)
+
+
 def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
     """Return a two-dimensional list representing <block> as rows and columns of
     unit cells.
@@ -74,34 +169,288 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
     """
     unit_num = int(math.pow(2, (block.max_depth - block.level)))
 
-    # if this block has no children (including unit cell case)
-    if len(block.children) == 0:
-        flattened = []
+    flattened = []
+    for _ in range(unit_num):
+        flattened.append([None] * unit_num)
 
-        for _ in range(unit_num):
-            column = []
-            for _ in range(unit_num):
-                column.append(block.colour)
-            flattened.append(column)
+    # fill in the unit cells covered by each leaf; leaves() reads the board
+    # without cloning any blocks it shares with other boards
+    for colour, _, _, column, row, width in block.leaves():
+        cells = [colour] * width
+        for i in range(column, column + width):
+            flattened[i][row:row + width] = cells
 
-        return flattened
+    return flattened
 
-    else:
-        # collect flattened children
-        flat_child = []
-        for child in block.children:
-            flat_child.append(_flatten(child))
 
-        # combine children in the upper block and lower block
-        upper = []
-        lower = []
-        for i in range(len(flat_child[0])):
-            upper.append(flat_child[1][i] + flat_child[2][i])
-            lower.append(flat_child[0][i] + flat_child[3][i])
+def _flatten_grid(block: Block) -> np.ndarray:
+    """Return a two-dimensional uint8 array representing <block> as columns
+    and rows of unit cells, in the same layout as _flatten.
+
+    Each unit cell holds the index in COLOUR_LIST of its colour instead of the
+    colour itself. A Block board keeps its grid up to date between calls, so
+    the array that is returned must not be modified.
+
+    >>> block = Block((0, 0), 750, COLOUR_LIST[2], 0, 1)
+    >>> _flatten_grid(block).tolist()
+    [[2, 2], [2, 2]]
+    """
+    if isinstance(block, Block):
+        return block.colour_grid()
+
+    unit_num = 2 ** (block.max_depth - block.level)
+    grid = np.empty((unit_num, unit_num), dtype=np.uint8)
 
-        flattened = upper + lower
+    for colour, _, _, column, row, width in block.leaves():
+        grid[column:column + width, row:row + width] = \
+            COLOUR_LIST.index(colour)
 
-        return flattened
+    return grid
+
+
+def _label_blobs(cells: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+    """Return the groups of connected cells of <cells> that are True, as an
+    array of labels in the same layout as <cells> and a list of sizes.
+
+    <cells> is a square boolean array. The cells of each group share a label,
+    numbered from 1, the cells that are False are labelled 0, and the group
+    with label i has sizes[i] cells. sizes[0] is 0.
+
+    Each column is split into runs of consecutive True cells, and the runs
+    that overlap in neighbouring columns are joined with a union-find, so the
+    running time is linear in the number of runs and nothing is recursive.
+
+    >>> labels, sizes = _label_blobs(np.array([[True, False], [False, True]]))
+    >>> labels.tolist(), sizes
+    ([[1, 0], [0, 2]], [0, 1, 1])
+    """
+    length = cells.shape[0]
+    padded = np.zeros((length, length + 2), dtype=np.int8)
+    padded[:, 1:-1] = cells
+    steps = np.diff(padded, axis=1)
+
+    # the runs are ordered by column, then by row
+    columns, starts = np.nonzero(steps == 1)
+    ends = np.nonzero(steps == -1)[1]
+    lengths = ends - starts
+    parents, run_sizes = _join_runs(length, columns, starts, ends,
+                                    [0] * len(starts))
+
+    # number the groups from 1, in the order of their first runs
+    numbers = {}
+    run_labels = []
+    for run in range(len(parents)):
+        root = _find(parents, run)
+        if root not in numbers:
+            numbers[root] = len(numbers) + 1
+        run_labels.append(numbers[root])
+    sizes = [0] * (len(numbers) + 1)
+    for root in numbers:
+        sizes[numbers[root]] = run_sizes[root]
+
+    # every cell of a run gets the label of the run
+    labels = np.zeros(cells.shape, dtype=np.int32)
+    offsets = np.arange(int(lengths.sum())) - \
+        np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cell_indices = np.repeat(columns * length + starts, lengths) + offsets
+    labels.reshape(-1)[cell_indices] = \
+        np.repeat(np.array(run_labels, dtype=np.int32), lengths)
+
+    return labels, sizes
+
+
+def _largest_blobs(grid: np.ndarray) -> List[int]:
+    """Return the number of unit cells in the largest blob of each colour in
+    <grid>, in the order of COLOUR_LIST.
+
+    <grid> is in the format returned by _flatten_grid. A single pass over the
+    runs of same-coloured cells in each column finds the blobs of every
+    colour at once.
+
+    >>> _largest_blobs(np.array([[0, 1], [0, 0]], dtype=np.uint8))
+    [3, 1, 0, 0]
+    """
+    length = grid.shape[0]
+    changes = np.ones((length, length + 1), dtype=bool)
+    changes[:, 1:-1] = grid[:, 1:] != grid[:, :-1]
+
+    # the runs are ordered by column, then by row
+    columns, starts = np.nonzero(changes[:, :-1])
+    ends = np.nonzero(changes[:, 1:])[1] + 1
+    values = grid[columns, starts].tolist()
+    parents, sizes = _join_runs(length, columns, starts, ends, values)
+
+    largest = [0] * len(COLOUR_LIST)
+    for run in range(len(parents)):
+        if parents[run] == run:
+            largest[values[run]] = max(largest[values[run]], sizes[run])
+    return largest
+
+
+def _join_runs(length: int, columns: np.ndarray, starts: np.ndarray,
+               ends: np.ndarray, values: List[int]) -> \
+        Tuple[List[int], List[int]]:
+    """Return a union-find over the runs of cells of a grid with <length>
+    columns, in which the runs that overlap in neighbouring columns and have
+    the same value are joined, and the sizes of the sets.
+
+    Run i is in column columns[i], from row starts[i] up to but not including
+    row ends[i], and has value values[i]. The runs are ordered by column, then
+    by row. The size of each set is stored at its representative.
+    """
+    first = np.searchsorted(columns, np.arange(length + 1)).tolist()
+    run_starts = starts.tolist()
+    run_ends = ends.tolist()
+
+    parents = list(range(len(run_starts)))
+    sizes = (ends - starts).tolist()
+
+    for column in range(length - 1):
+        left, left_end = first[column], first[column + 1]
+        right, right_end = first[column + 1], first[column + 2]
+        while left < left_end and right < right_end:
+            if run_starts[left] < run_ends[right] and \
+                    run_starts[right] < run_ends[left] and \
+                    values[left] == values[right]:
+                root = _find(parents, left)
+                other = _find(parents, right)
+                if root != other:
+                    if sizes[root] < sizes[other]:
+                        root, other = other, root
+                    parents[other] = root
+                    sizes[root] += sizes[other]
+            if run_ends[left] < run_ends[right]:
+                left += 1
+            else:
+                right += 1
+
+    return parents, sizes
+
+
+def _ring(column: int, row: int, width: int) -> \
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the unit cells just outside the square of <width> unit cells
+    whose top left unit cell is at <column> and <row>, in order around it.
+
+    The cells are returned as an array of columns, an array of rows, and an
+    array that is True for the four corner cells, which do not share an edge
+    with the square. Each cell shares an edge with the next one, and the last
+    cell with the first.
+
+    >>> columns, rows, corners = _ring(0, 0, 1)
+    >>> list(zip(columns.tolist(), rows.tolist()))[:4]
+    [(-1, -1), (0, -1), (1, -1), (1, 0)]
+    >>> corners.tolist()
+    [True, False, True, False, True, False, True, False]
+    """
+    side = np.arange(width)
+    columns = np.concatenate([np.arange(column - 1, column + width + 1),
+                              np.full(width, column + width),
+                              np.arange(column + width, column - 2, -1),
+                              np.full(width, column - 1)])
+    rows = np.concatenate([np.full(width + 2, row - 1), row + side,
+                           np.full(width + 2, row + width),
+                           row + width - 1 - side])
+    corners = np.zeros(4 * width + 4, dtype=bool)
+    corners[[0, width + 1, 2 * width + 2, 3 * width + 3]] = True
+    return columns, rows, corners
+
+
+def _outermost(squares: List[Tuple[int, int, int]]) -> \
+        List[Tuple[int, int, int]]:
+    """Return the squares in <squares> that are not within another one.
+
+    Each square is given by the column and the row of its top left unit cell
+    and its width, and any two of them are either disjoint or one is within
+    the other, as the squares of blocks are.
+
+    >>> _outermost([(0, 0, 1), (0, 0, 2), (2, 0, 2), (0, 0, 2)])
+    [(0, 0, 2), (2, 0, 2)]
+    """
+    outermost = []
+    for column, row, width in sorted(set(squares),
+                                     key=lambda s: (-s[2], s[0], s[1])):
+        within = False
+        for other_column, other_row, other_width in outermost:
+            if other_column <= column < other_column + other_width and \
+                    other_row <= row < other_row + other_width:
+                within = True
+                break
+        if not within:
+            outermost.append((column, row, width))
+    return outermost
+
+
+def _largest_leaf_blob(squares: List[Tuple[int, int, int]]) -> int:
+    """Return the number of unit cells in the largest group of connected
+    squares in <squares>.
+
+    Each square is given by the column and the row of its top left unit cell
+    and its width in unit cells, as in Block.leaves, and no two squares
+    overlap. Two squares are connected if they share part of an edge.
+
+    The edges of the squares are grouped by the line they lie on, and the
+    squares on either side of each line are matched up in order, so the
+    running time depends on the number of squares and not on the number of
+    unit cells.
+
+    >>> _largest_leaf_blob([(0, 0, 2), (2, 1, 1), (3, 3, 1)])
+    5
+    >>> _largest_leaf_blob([])
+    0
+    """
+    parents = list(range(len(squares)))
+    sizes = [width * width for _, _, width in squares]
+    largest = max(sizes, default=0)
+
+    for axis in range(2):
+        # for each line across <axis>, the spans of the squares that end on
+        # it and of the squares that start on it
+        ending = {}
+        starting = {}
+        for i in range(len(squares)):
+            width = squares[i][2]
+            line = squares[i][axis]
+            start = squares[i][1 - axis]
+            span = (start, start + width, i)
+            ending.setdefault(line + width, []).append(span)
+            starting.setdefault(line, []).append(span)
+
+        for line in ending:
+            if line not in starting:
+                continue
+            before = sorted(ending[line])
+            after = sorted(starting[line])
+            left = 0
+            right = 0
+            while left < len(before) and right < len(after):
+                start, end, item = before[left]
+                other_start, other_end, other = after[right]
+                if start < other_end and other_start < end:
+                    root = _find(parents, item)
+                    other = _find(parents, other)
+                    if root != other:
+                        if sizes[root] < sizes[other]:
+                            root, other = other, root
+                        parents[other] = root
+                        sizes[root] += sizes[other]
+                        largest = max(largest, sizes[root])
+                if end < other_end:
+                    left += 1
+                else:
+                    right += 1
+
+    return largest
+
+
+def _find(parents: List[int], item: int) -> int:
+    """Return the representative of the set that <item> belongs to in the
+    union-find <parents>, halving the path to it on the way.
+    """
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
 
 
 class Goal:
@@ -128,6 +477,16 @@ class Goal:
         """
         raise NotImplementedError
 
+    def upper_bound(self, board: Block, moves_remaining: int) -> int:
+        """Return a number that the score for this goal on the given board
+        cannot exceed after at most <moves_remaining> more moves, by any
+        player.
+
+        The bound is meant to be much cheaper to compute than the score, so
+        that a search can skip the boards that cannot beat its best score.
+        """
+        raise NotImplementedError
+
     def description(self) -> str:
         """Return a description of this goal.
         """
@@ -152,20 +511,55 @@ class PerimeterGoal(Goal):
 
         The score is always greater than or equal to 0.
         """
-        total = 0
-        length = len(_flatten(board))
-        edge = length - 1
-        flat_board = _flatten(board)
+        if self.colour not in COLOUR_LIST:
+            return 0
+
+        # a Block keeps the colours of its edge cells counted
+        if isinstance(board, Block):
+            return board.edge_counts()[COLOUR_LIST.index(self.colour)]
 
-        for j in [0, edge]:
-            for i in range(length):
-                if flat_board[i][j] == self.colour:
-                    total += 1
-                if flat_board[j][i] == self.colour:
-                    total += 1
+        last = 2 ** (board.max_depth - board.level)
+
+        # only the leaves along the edges are visited; each one scores its
+        # width once for every edge it touches, so corner cells count twice
+        total = 0
+        for colour, _, _, column, row, width in board.leaves(True):
+            if colour != self.colour:
+                continue
+            edges = (column == 0) + (row == 0) + (column + width == last) + \
+                (row + width == last)
+            total += edges * width
 
         return total
 
+    def upper_bound(self, board: Block, moves_remaining: int) -> int:
+        """Return a number that the score for this goal on the given board
+        cannot exceed after at most <moves_remaining> more moves, by any
+        player.
+
+        With no moves remaining this is the score itself. Otherwise the target
+        cells that can be on the board are counted, with the four corner cells
+        counting twice, since rotations and swaps can move cells to the edges.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> goal = PerimeterGoal(COLOUR_LIST[1])
+        >>> goal.upper_bound(board, 0)
+        0
+        >>> goal.upper_bound(board, 1)
+        16
+        """
+        if self.colour not in COLOUR_LIST:
+            return 0
+        if moves_remaining == 0:
+            return self.score(board)
+
+        last = 2 ** (board.max_depth - board.level)
+        cells = _reachable_cells(board, self.colour, moves_remaining)
+        if last == 1:
+            # a single cell is on all four edges
+            return 4 * cells
+        return min(4 * last, cells + min(cells, 4))
+
     def description(self) -> str:
         """Return a description of this goal.
         """
@@ -183,33 +577,68 @@ class BlobGoal(Goal):
         The target colour for this goal, that is the colour to which
         this goal applies.
     """
+    # === Private Attributes ===
+    # _index:
+    #   The BlobIndex of the last board this goal scored more than once, or
+    #   None.
+    # _scored:
+    #   The last board this goal scored without a BlobIndex, or None.
     colour: Tuple[int, int, int]
+    _index: Optional[BlobIndex]
+    _scored: Optional[Block]
+
+    def __init__(self, target_colour: Tuple[int, int, int]) -> None:
+        """Initialize this goal to have the given target colour.
+        """
+        Goal.__init__(self, target_colour)
+        self._index = None
+        self._scored = None
 
     def score(self, board: Block) -> int:
         """Return the current score for this goal on the given board.
 
         The score is always greater than or equal to 0.
+
+        A board is scored from its leaves the first time. Once the same whole
+        board is scored again, after some moves, its blobs are kept in a
+        BlobIndex, so that scoring it again only looks at the squares that the
+        moves changed.
         """
-        # create a flat board
-        flat = _flatten(board)
-        length = len(flat)
-
-        # create a parallel visited board
-        visited = []
-        for _ in range(length):
-            column = []
-            for _ in range(length):
-                column.append(-1)
-            visited.append(column)
-
-        # check on each unit cell on board and store their related blob size
-        all_scores = []
-        for i in range(length):
-            for j in range(length):
-                score = self._undiscovered_blob_size((i, j), flat, visited)
-                all_scores.append(score)
-
-        return max(all_scores)
+        if self.colour not in COLOUR_LIST:
+            return 0
+
+        if isinstance(board, Block) and board.level == 0:
+            if self._index is not None and self._index.board is board:
+                return self._index.largest()
+            if self._scored is board:
+                self._index = BlobIndex(board, COLOUR_LIST.index(self.colour))
+                self._scored = None
+                return self._index.largest()
+            self._scored = board
+
+        # the blobs are found among the leaves of the target colour, each
+        # weighted by its area, instead of among the unit cells
+        squares = [(column, row, width)
+                   for colour, _, _, column, row, width in board.leaves()
+                   if colour == self.colour]
+
+        return _largest_leaf_blob(squares)
+
+    def upper_bound(self, board: Block, moves_remaining: int) -> int:
+        """Return a number that the score for this goal on the given board
+        cannot exceed after at most <moves_remaining> more moves, by any
+        player.
+
+        No blob can be larger than the number of target cells that can be on
+        the board.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> BlobGoal(COLOUR_LIST[0]).upper_bound(board, 3)
+        16
+        """
+        if self.colour not in COLOUR_LIST:
+            return 0
+        return _reachable_cells(board, self.colour, moves_remaining)
 
     def _undiscovered_blob_size(self, pos: Tuple[int, int],
                                 board: List[List[Tuple[int, int, int]]],
@@ -231,41 +660,348 @@ class BlobGoal(Goal):
         Update <visited> so that all cells that are visited are marked with
         either 0 or 1.
         """
-        column = pos[0]
-        row = pos[1]
+        # the cells still to be visited are kept on an explicit stack, so a
+        # large blob cannot exceed the recursion limit
+        count = 0
+        pending = [pos]
+        while len(pending) != 0:
+            column, row = pending.pop()
+
+            # if pos is negative or out of the board, do nothing
+            if column < 0 or row < 0 or column >= len(board) or \
+                    row >= len(board):
+                continue
+
+            # if the colour does not match target colour, mark it
+            if board[column][row] != self.colour:
+                visited[column][row] = 0
+                continue
+
+            # if the cell has been visited, do nothing
+            if visited[column][row] != -1:
+                continue
+
+            # this unit cell has been verified, mark it
+            count += 1
+            visited[column][row] = 1
+
+            # visit its neighbours
+            pending.extend([(column - 1, row), (column + 1, row),
+                            (column, row + 1), (column, row - 1)])
 
-        # if pos is negative or out of the board, do nothing
-        if column < 0 or row < 0 or column >= len(board) or row >= len(board):
-            return 0
+        return count
 
-        # if the colour does not match target colour, mark it
-        if board[column][row] != self.colour:
-            visited[column][row] = 0
-            return 0
+    def description(self) -> str:
+        """Return a description of this goal.
+        """
+        return f'Aim for the largest blob of {colour_name(self.colour)}.'
 
-        # if the cell has been visited, do nothing
-        if visited[column][row] != -1:
-            return 0
 
-        # this unit cell has been verified, mark it
-        count = 1
-        visited[column][row] = 1
+class BlobIndex:
+    """The blobs of one colour on a board, kept up to date as the board
+    changes.
 
-        # visit its neighbours
-        left_pos = (column - 1, row)
-        right_pos = (column + 1, row)
-        up_pos = (column, row + 1)
-        down_pos = (column, row - 1)
+    The blobs are brought up to date from the squares of the board's
+    ColourGrid that were painted since they were last computed: the cells of
+    those squares are taken out of their blobs, labelled again on their own,
+    and joined to the blobs around them. The whole board is only labelled
+    again when taking the cells out may have split a blob in a way that the
+    cells right around the squares cannot tell.
 
-        for position in [left_pos, right_pos, up_pos, down_pos]:
-            count += self._undiscovered_blob_size(position, board, visited)
+    === Public Attributes ===
+    board:
+        The board whose blobs are kept. Its level is 0.
+    colour_index:
+        The index in COLOUR_LIST of the colour of the blobs.
+    """
+    # === Private Attributes ===
+    # _version:
+    #   The version of the ColourGrid of <board> that the blobs are up to date
+    #   with.
+    # _labels:
+    #   _labels[i, j] is 0 if the unit cell at column i and row j is not of the
+    #   colour, and otherwise a label in the same set of _parents as the
+    #   labels of the rest of its blob.
+    # _parents:
+    #   A union-find over the labels. Label 0 is not used.
+    # _sizes:
+    #   _sizes[label] is the number of unit cells in the blob of <label>, if
+    #   <label> is the representative of its set in _parents.
+    # _heap:
+    #   A heap of (-size, label) pairs that has a pair for the current size of
+    #   every blob. Pairs whose label is no longer a representative, or whose
+    #   size is no longer the size of the blob, are skipped.
+    board: Block
+    colour_index: int
+    _version: int
+    _labels: np.ndarray
+    _parents: List[int]
+    _sizes: List[int]
+    _heap: List[Tuple[int, int]]
+
+    def __init__(self, board: Block, colour_index: int) -> None:
+        """Initialize the blobs of the colour with <colour_index> on <board>.
+
+        Precondition: board.level == 0
+        """
+        self.board = board
+        self.colour_index = colour_index
+        self._relabel()
+
+    def largest(self) -> int:
+        """Return the number of unit cells in the largest blob on the board as
+        it is now.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> index = BlobIndex(board, 0)
+        >>> index.largest()
+        16
+        >>> _ = board.smash()
+        >>> index.largest() == BlobGoal(COLOUR_LIST[0]).score(board)
+        True
+        """
+        self._update()
+        heap = self._heap
+        while len(heap) != 0:
+            size, label = heap[0]
+            if self._parents[label] == label and self._sizes[label] == -size:
+                return -size
+            heapq.heappop(heap)
+        return 0
+
+    def _relabel(self) -> None:
+        """Label every unit cell of the board again.
+        """
+        grid = self.board.board_grid()
+        self._version = grid.version
+        self._labels, self._sizes = _label_blobs(grid.cells ==
+                                                 self.colour_index)
+        self._parents = list(range(len(self._sizes)))
+        self._heap = [(-self._sizes[label], label)
+                      for label in range(1, len(self._sizes))]
+        heapq.heapify(self._heap)
+
+    def _update(self) -> None:
+        """Bring the blobs up to date with the board.
+        """
+        grid = self.board.board_grid()
+        squares = grid.painted_since(self._version)
+        if squares is not None and len(squares) == 0:
+            return
+        if squares is None or len(squares) > _BLOB_SQUARE_LIMIT or \
+                self._labels.size < _BLOB_INCREMENTAL_CELLS or \
+                len(self._parents) > self._labels.size:
+            self._relabel()
+            return
+
+        self._version = grid.version
+        squares = _outermost(squares)
+        if not self._remove(squares):
+            self._relabel()
+            return
+
+        for square in squares:
+            self._add(grid.cells, square)
+        for square in squares:
+            self._join(square)
+
+    def _remove(self, squares: List[Tuple[int, int, int]]) -> bool:
+        """Take the unit cells of <squares> out of their blobs.
+
+        Return True iff every blob that is left with some of its cells is
+        known to still be connected.
+        """
+        shrunk = set()
+        for column, row, width in squares:
+            old = self._labels[column:column + width, row:row + width]
+            values, counts = np.unique(old, return_counts=True)
+            for value, count in zip(values.tolist(), counts.tolist()):
+                if value != 0:
+                    root = _find(self._parents, value)
+                    self._sizes[root] -= count
+                    shrunk.add(root)
+            old[:] = 0
+
+        for root in shrunk:
+            if self._sizes[root] != 0:
+                if not self._still_connected(root, squares):
+                    return False
+                heapq.heappush(self._heap, (-self._sizes[root], root))
+        return True
+
+    def _still_connected(self, root: int,
+                         squares: List[Tuple[int, int, int]]) -> bool:
+        """Return True if the cells of the blob of <root> are known to be
+        connected after the cells of <squares> were taken out of it.
+
+        Every part of what is left of the blob touches one of <squares>, so
+        it is still connected if it only touches one square, and the cells
+        that touch it are all on one stretch of the blob's cells around it.
+        """
+        length = self._labels.shape[0]
+        touched = False
+        for column, row, width in squares:
+            columns, rows, corners = _ring(column, row, width)
+            inside = (columns >= 0) & (columns < length) & (rows >= 0) & \
+                (rows < length)
+            values = np.zeros(len(columns), dtype=np.int32)
+            values[inside] = self._labels[columns[inside], rows[inside]]
+            members = [value for value in np.unique(values).tolist()
+                       if value != 0 and _find(self._parents, value) == root]
+            blob = np.isin(values, members)
+            touching = blob & ~corners
+            if not touching.any():
+                continue
+            if touched:
+                return False
+            touched = True
+            if blob.all():
+                continue
+
+            # start the ring at a cell outside the blob, and number the
+            # stretches of blob cells around it
+            start = int(np.argmin(blob))
+            blob = np.roll(blob, -start)
+            touching = np.roll(touching, -start)
+            stretches = np.cumsum(blob & ~np.roll(blob, 1))
+            if len(np.unique(stretches[touching])) > 1:
+                return False
+
+        return True
+
+    def _add(self, cells: np.ndarray, square: Tuple[int, int, int]) -> None:
+        """Label the unit cells of <square> in <cells> that are of the colour,
+        as blobs of their own.
+        """
+        column, row, width = square
+        labels, sizes = _label_blobs(cells[column:column + width,
+                                           row:row + width] ==
+                                     self.colour_index)
+        base = len(self._parents) - 1
+        self._labels[column:column + width, row:row + width] = \
+            np.where(labels != 0, labels + base, 0)
+        for label in range(1, len(sizes)):
+            self._parents.append(base + label)
+            self._sizes.append(sizes[label])
+            heapq.heappush(self._heap, (-sizes[label], base + label))
+
+    def _join(self, square: Tuple[int, int, int]) -> None:
+        """Join the blobs that meet across the edges of <square>.
+        """
+        column, row, width = square
+        length = self._labels.shape[0]
+        labels = self._labels
+        end_column = column + width
+        end_row = row + width
+
+        # pairs of the cells just inside and just outside each edge
+        edges = []
+        if column > 0:
+            edges.append((labels[column, row:end_row],
+                          labels[column - 1, row:end_row]))
+        if end_column < length:
+            edges.append((labels[end_column - 1, row:end_row],
+                          labels[end_column, row:end_row]))
+        if row > 0:
+            edges.append((labels[column:end_column, row],
+                          labels[column:end_column, row - 1]))
+        if end_row < length:
+            edges.append((labels[column:end_column, end_row - 1],
+                          labels[column:end_column, end_row]))
+
+        for inside, outside in edges:
+            both = (inside != 0) & (outside != 0)
+            for label, other in set(zip(inside[both].tolist(),
+                                        outside[both].tolist())):
+                root = _find(self._parents, label)
+                other = _find(self._parents, other)
+                if root == other:
+                    continue
+                if self._sizes[root] < self._sizes[other]:
+                    root, other = other, root
+                self._parents[other] = root
+                self._sizes[root] += self._sizes[other]
+                heapq.heappush(self._heap, (-self._sizes[root], root))
+
+
+class ScoreCache:
+    """A bounded record of the scores of goals on boards, so that a board that
+    is scored again does not have to be scored from scratch.
+
+    A score is looked up by the structural hash, level and max_depth of the
+    board, and the type and colour of the goal. When the cache is full, the
+    score that was used least recently is forgotten.
+
+    === Public Attributes ===
+    capacity:
+        The most scores that are remembered.
+    hits:
+        The number of scores that were found in the cache.
+    misses:
+        The number of scores that had to be computed.
+
+    === Representation Invariants ===
+    - capacity >= 0
+    - len(self) <= capacity
+
+    >>> cache = ScoreCache(2)
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> cache.score(BlobGoal(COLOUR_LIST[0]), board)
+    4
+    >>> cache.score(BlobGoal(COLOUR_LIST[0]), board)
+    4
+    >>> cache.hits, cache.misses
+    (1, 1)
+    """
+    # === Private Attributes ===
+    # _scores:
+    #   The remembered scores by key, least recently used first.
+    capacity: int
+    hits: int
+    misses: int
+    _scores: OrderedDict
+
+    def __init__(self, capacity: int = SCORE_CACHE_SIZE) -> None:
+        """Initialize an empty cache that remembers up to <capacity> scores.
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
 
-        return count
+    def __len__(self) -> int:
+        """Return the number of scores remembered.
+        """
+        return len(self._scores)
 
-    def description(self) -> str:
-        """Return a description of this goal.
+    def score(self, goal: Goal, board: Block) -> int:
+        """Return goal.score(board), remembering it for next time.
         """
-        return f'Aim for the largest blob of {colour_name(self.colour)}.'
+        key = (board.structural_hash(), board.level, board.max_depth,
+               type(goal), goal.colour)
+        if key in self._scores:
+            self.hits += 1
+            self._scores.move_to_end(key)
+            return self._scores[key]
+
+        self.misses += 1
+        score = goal.score(board)
+        if self.capacity > 0:
+            if len(self._scores) >= self.capacity:
+                self._scores.popitem(last=False)
+            self._scores[key] = score
+        return score
+
+    def clear(self) -> None:
+        """Forget every score and reset the counters.
+        """
+        self._scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# The cache shared by everything that scores boards during a game.
+SCORE_CACHE = ScoreCache()
 
 
 if __name__ == '__main__':
@@ -274,7 +1010,7 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'math', '__future__', 'numpy', 'heapq', 'collections'
         ],
         'max-attributes': 15
     })
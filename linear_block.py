@@ -0,0 +1,666 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a compact, array-backed alternative to the Block class.
+
+A LinearBoard stores a whole quadtree in three flat arrays instead of one
+Python object per node. The four children of a node always occupy four
+consecutive slots of those arrays, so a node only needs to remember the offset
+of its first child. Levels, positions and sizes are not stored at all: they are
+derived from the root while descending the tree.
+
+A LinearBlock is a lightweight view of one node of a LinearBoard. It has the
+same public attributes and operations as a Block, so the rest of the game can
+use it wherever a Block is expected.
+"""
+from __future__ import annotations
+from array import array
+from typing import Optional, Tuple, List
+import random
+import math
+
+from settings import colour_name, COLOUR_LIST
+from zobrist import leaf_key, parent_key
+
+# The kinds of node stored in LinearBoard.kinds
+LEAF = 0
+PARENT = 1
+
+# The value stored in LinearBoard.colours for a node that has children
+NO_COLOUR = 255
+
+# The value stored in LinearBoard.first_child for a node with no children
+NO_CHILD = -1
+
+
+class LinearBoard:
+    """The flat storage behind a tree of LinearBlocks.
+
+    Node 0 is always the root. The children of node i are stored at
+    first_child[i], first_child[i] + 1, first_child[i] + 2 and
+    first_child[i] + 3, in the same order as Block.children.
+
+    === Public Attributes ===
+    position:
+        The (x, y) coordinates of the upper left corner of the root.
+    size:
+        The height and width of the root.
+    level:
+        The level of the root.
+    max_depth:
+        The deepest level allowed in the overall block structure.
+    kinds:
+        kinds[i] is LEAF or PARENT.
+    colours:
+        colours[i] is the index in COLOUR_LIST of the colour of node i, or
+        NO_COLOUR if node i has children.
+    first_child:
+        first_child[i] is the index of the first child of node i, or NO_CHILD
+        if node i is a leaf.
+
+    === Representation Invariants ===
+    - len(kinds) == len(colours) == len(first_child)
+    - kinds[i] == PARENT iff first_child[i] != NO_CHILD
+    - kinds[i] == PARENT iff colours[i] == NO_COLOUR
+    """
+    # === Private Attributes ===
+    # _free:
+    #   The offsets of runs of four slots that were released by combine or by
+    #   undoing a smash, and can be reused by the next smash.
+    position: Tuple[int, int]
+    size: int
+    level: int
+    max_depth: int
+    kinds: bytearray
+    colours: bytearray
+    first_child: array
+    _free: List[int]
+
+    def __init__(self, position: Tuple[int, int], size: int, colour_index: int,
+                 level: int, max_depth: int) -> None:
+        """Initialize this board with a single leaf root of the colour at
+        <colour_index> in COLOUR_LIST.
+        """
+        self.position = position
+        self.size = size
+        self.level = level
+        self.max_depth = max_depth
+        self.kinds = bytearray([LEAF])
+        self.colours = bytearray([colour_index])
+        self.first_child = array('l', [NO_CHILD])
+        self._free = []
+
+    def allocate_children(self) -> int:
+        """Return the offset of four fresh leaf slots.
+        """
+        if len(self._free) != 0:
+            return self._free.pop()
+
+        offset = len(self.kinds)
+        self.kinds.extend([LEAF] * 4)
+        self.colours.extend([0] * 4)
+        self.first_child.extend([NO_CHILD] * 4)
+        return offset
+
+    def release_children(self, node: int) -> None:
+        """Turn <node> into a leaf and release the slots of all its
+        descendants.
+
+        The slots are released in the reverse of the order in which a smash of
+        <node> allocates them, so that undoing a smash gives allocate_children
+        back the same slots, in the same order, as before the smash.
+        """
+        # the parents below <node> in the order LinearBlock.smash reaches them
+        parents = []
+        pending = [node]
+        while len(pending) != 0:
+            parent = pending.pop()
+            parents.append(parent)
+            first = self.first_child[parent]
+            for i in range(3, -1, -1):
+                if self.kinds[first + i] == PARENT:
+                    pending.append(first + i)
+
+        for parent in reversed(parents):
+            self._free.append(self.first_child[parent])
+            self.kinds[parent] = LEAF
+            self.first_child[parent] = NO_CHILD
+
+    def permute_children(self, node: int, order: List[int]) -> None:
+        """Reorder the children of <node> so that its new i-th child is its old
+        order[i]-th child.
+        """
+        first = self.first_child[node]
+        kinds = [self.kinds[first + i] for i in order]
+        colours = [self.colours[first + i] for i in order]
+        children = [self.first_child[first + i] for i in order]
+
+        for i in range(4):
+            self.kinds[first + i] = kinds[i]
+            self.colours[first + i] = colours[i]
+            self.first_child[first + i] = children[i]
+
+    def copy_subtree(self, node: int, position: Tuple[int, int], size: int,
+                     level: int) -> LinearBoard:
+        """Return a new LinearBoard whose root is a copy of <node>, which is
+        at <position> with dimensions <size> by <size> and at <level>.
+        """
+        if node == 0:
+            # The whole board is being copied, so the arrays can be copied
+            # as they are.
+            board = LinearBoard(position, size, 0, level, self.max_depth)
+            board.kinds = bytearray(self.kinds)
+            board.colours = bytearray(self.colours)
+            board.first_child = array('l', self.first_child)
+            board._free = list(self._free)
+            return board
+
+        board = LinearBoard(position, size, self.colours[node], level,
+                            self.max_depth)
+        # pairs of (node in self, node in board) still to be copied
+        pending = [(node, 0)]
+        while len(pending) != 0:
+            source, target = pending.pop()
+            board.kinds[target] = self.kinds[source]
+            board.colours[target] = self.colours[source]
+
+            if self.kinds[source] == PARENT:
+                first = board.allocate_children()
+                board.first_child[target] = first
+                for i in range(4):
+                    pending.append((self.first_child[source] + i, first + i))
+
+        return board
+
+
+def generate_linear_board(max_depth: int, size: int) -> LinearBlock:
+    """Return a new compact game board with a depth of <max_depth> and
+    dimensions of <size> by <size>.
+
+    >>> board = generate_linear_board(3, 750)
+    >>> board.max_depth
+    3
+    >>> board.size
+    750
+    >>> len(board.children) == 4
+    True
+    """
+    colour = random.choice(COLOUR_LIST)
+    board = LinearBlock(LinearBoard((0, 0), size, COLOUR_LIST.index(colour), 0,
+                                    max_depth))
+    board.smash()
+
+    return board
+
+
+def _symmetry_order(symmetry: int) -> List[int]:
+    """Return the indices of the children of a block, in the order they end
+    up in once <symmetry> is applied to it, numbered as in
+    Block.symmetry_hash.
+
+    >>> _symmetry_order(1)
+    [1, 2, 3, 0]
+    """
+    if symmetry < 4:
+        return [(i + symmetry) % 4 for i in range(4)]
+    return [(1 - i - symmetry) % 4 for i in range(4)]
+
+
+class LinearBlock:
+    """A view of one node of a LinearBoard that behaves like a Block.
+
+    Views are cheap to create and hold no state of their own besides the
+    geometry of the node they refer to. Two views of the same node see the
+    same changes.
+
+    === Public Attributes ===
+    position:
+        The (x, y) coordinates of the upper left corner of this Block.
+    size:
+        The height and width of this square Block.
+    level:
+        The level of this block within the overall block structure.
+    max_depth:
+        The deepest level allowed in the overall block structure.
+    """
+    # === Private Attributes ===
+    # _board:
+    #   The storage this view refers to.
+    # _node:
+    #   The index of the node of _board this view refers to.
+    position: Tuple[int, int]
+    size: int
+    level: int
+    max_depth: int
+    _board: LinearBoard
+    _node: int
+
+    def __init__(self, board: LinearBoard, node: int = 0,
+                 position: Optional[Tuple[int, int]] = None,
+                 size: Optional[int] = None,
+                 level: Optional[int] = None) -> None:
+        """Initialize a view of <node> in <board>, which is at <position> with
+        dimensions <size> by <size> and at <level>.
+
+        If the geometry is not given, <node> must be the root of <board>.
+        """
+        self._board = board
+        self._node = node
+        self.position = board.position if position is None else position
+        self.size = board.size if size is None else size
+        self.level = board.level if level is None else level
+        self.max_depth = board.max_depth
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block, or None if it has children.
+        """
+        index = self._board.colours[self._node]
+        if index == NO_COLOUR:
+            return None
+        return COLOUR_LIST[index]
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        """Set the colour of this block, which must be a leaf.
+        """
+        self._board.colours[self._node] = COLOUR_LIST.index(colour)
+
+    @property
+    def _frame(self) -> int:
+        """The number of quarter turns this block has been given by its
+        ancestors and not yet passed on, as in Block.
+
+        A rotation of a LinearBlock reaches all its descendants at once, so
+        this is always 0.
+        """
+        return 0
+
+    @property
+    def children(self) -> List[LinearBlock]:
+        """Views of the children of this block, in the same order as
+        Block.children.
+        """
+        first = self._board.first_child[self._node]
+        if first == NO_CHILD:
+            return []
+
+        size = self._child_size()
+        level = self.level + 1
+        positions = self._children_positions()
+
+        return [LinearBlock(self._board, first + i, positions[i], size, level)
+                for i in range(4)]
+
+    def leaves(self, boundary: bool = False) -> \
+            List[Tuple[Tuple[int, int, int], Tuple[int, int], int, int, int,
+                       int]]:
+        """Return a list of tuples describing every undivided Block within this
+        Block, in the same format as Block.leaves.
+
+        If <boundary> is True, only the undivided Blocks that touch an edge of
+        this Block are described.
+        """
+        board = self._board
+        last = 2 ** (self.max_depth - self.level)
+        result = []
+        pending = [(self._node, self.position, self.size, self.level, 0, 0)]
+        while len(pending) != 0:
+            node, position, size, level, column, row = pending.pop()
+            width = 2 ** (self.max_depth - level)
+
+            if board.kinds[node] == LEAF:
+                result.append((COLOUR_LIST[board.colours[node]], position,
+                               size, column, row, width))
+                continue
+
+            x = position[0]
+            y = position[1]
+            half_size = round(size / 2.0)
+            half = width // 2
+            first = board.first_child[node]
+            children = [(first, (x + half_size, y), column + half, row),
+                        (first + 1, (x, y), column, row),
+                        (first + 2, (x, y + half_size), column, row + half),
+                        (first + 3, (x + half_size, y + half_size),
+                         column + half, row + half)]
+            for child, child_position, child_column, child_row in children:
+                if boundary and 0 < child_column < last - half and \
+                        0 < child_row < last - half:
+                    continue
+                pending.append((child, child_position, half_size, level + 1,
+                                child_column, child_row))
+
+        return result
+
+    def structural_hash(self) -> int:
+        """Return a 64-bit hash of the colours, levels and arrangement of the
+        blocks within this Block.
+
+        The hash is the same as that of an equal Block. It is computed from
+        scratch on every call.
+        """
+        return self.symmetry_hash(0)
+
+    def symmetry_hash(self, symmetry: int) -> int:
+        """Return the structural hash of this Block after <symmetry> is applied
+        to it, numbered as in Block.symmetry_hash.
+
+        The hash is the same as that of an equal Block. It is computed from
+        scratch on every call.
+
+        >>> block = generate_linear_board(2, 750)
+        >>> turned = block.create_copy()
+        >>> turned.rotate(1)
+        True
+        >>> turned.structural_hash() == block.symmetry_hash(1)
+        True
+        """
+        board = self._board
+        if board.kinds[self._node] == LEAF:
+            return leaf_key(self.level, COLOUR_LIST[board.colours[self._node]])
+
+        children = self.children
+        keys = [children[i].symmetry_hash(symmetry)
+                for i in _symmetry_order(symmetry)]
+        return parent_key(self.level, keys)
+
+    def canonical_key(self) -> int:
+        """Return the smallest structural hash of the eight boards that this
+        Block can be turned into by rotating and reflecting it, as in
+        Block.canonical_key.
+
+        The key is computed from scratch on every call.
+        """
+        return min(self.symmetry_hash(symmetry) for symmetry in range(8))
+
+    def canonical_form(self) -> LinearBlock:
+        """Return a new Block that is a deep copy of this Block, rotated and
+        reflected so that its structural hash is its canonical key.
+
+        >>> block = generate_linear_board(3, 750)
+        >>> canonical = block.canonical_form()
+        >>> canonical.structural_hash() == block.canonical_key()
+        True
+        >>> canonical.canonical_form() == canonical
+        True
+        """
+        hashes = [self.symmetry_hash(symmetry) for symmetry in range(8)]
+        order = _symmetry_order(hashes.index(min(hashes)))
+
+        copy = self.create_copy()
+        board = copy._board
+        # every block is given the same symmetry as the whole board
+        pending = [0]
+        while len(pending) != 0:
+            node = pending.pop()
+            if board.kinds[node] == PARENT:
+                board.permute_children(node, order)
+                first = board.first_child[node]
+                pending.extend(range(first, first + 4))
+        return copy
+
+    def colour_counts(self) -> List[int]:
+        """Return the number of unit cells of each colour in this Block, in the
+        order of COLOUR_LIST.
+
+        The counts are computed from scratch on every call.
+
+        >>> block = LinearBlock(LinearBoard((0, 0), 750, 1, 0, 1))
+        >>> block.colour_counts()
+        [0, 4, 0, 0]
+        """
+        counts = [0] * len(COLOUR_LIST)
+        for leaf in self.leaves():
+            counts[COLOUR_LIST.index(leaf[0])] += leaf[5] * leaf[5]
+        return counts
+
+    def __str__(self) -> str:
+        """Return this Block in a string format.
+
+        >>> block = LinearBlock(LinearBoard((0, 0), 750, 0, 0, 1))
+        >>> str(block)
+        'Leaf: colour=Pacific Point, pos=(0, 0), size=750, level=0\\n'
+        """
+        indents = '\t' * self.level
+        if self._board.kinds[self._node] == LEAF:
+            colour = colour_name(self.colour)
+            return f'{indents}Leaf: colour={colour}, pos={self.position}, ' \
+                   f'size={self.size}, level={self.level}\n'
+
+        result = f'{indents}Parent: pos={self.position},' \
+                 f'size={self.size}, level={self.level}\n'
+        for child in self.children:
+            result += str(child)
+
+        return result
+
+    def __eq__(self, other: LinearBlock) -> bool:
+        """Return True iff this Block and all its descendents are equivalent to
+        the <other> Block and all its descendents.
+        """
+        if self.position != other.position or self.size != other.size or \
+                self.level != other.level or \
+                self.max_depth != other.max_depth or \
+                self.colour != other.colour:
+            return False
+
+        ours = self.children
+        theirs = other.children
+        if len(ours) != len(theirs):
+            return False
+
+        for i in range(len(ours)):
+            if ours[i] != theirs[i]:
+                return False
+
+        return True
+
+    def _child_size(self) -> int:
+        """Return the size of this Block's children.
+        """
+        return round(self.size / 2.0)
+
+    def _children_positions(self) -> List[Tuple[int, int]]:
+        """Return the positions of this Block's four children.
+
+        The positions are returned in this order: upper-right child, upper-left
+        child, lower-left child, lower-right child.
+        """
+        x = self.position[0]
+        y = self.position[1]
+        size = self._child_size()
+
+        return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
+
+    def smashable(self) -> bool:
+        """Return True iff this block can be smashed.
+        """
+        return self.level != self.max_depth and \
+            self._board.kinds[self._node] == LEAF
+
+    def smash(self) -> bool:
+        """Sub-divide this block so that it has four randomly generated
+        children.
+
+        Return True iff the smash was performed.
+        """
+        if not self.smashable():
+            return False
+
+        board = self._board
+        first = board.allocate_children()
+        board.kinds[self._node] = PARENT
+        board.colours[self._node] = NO_COLOUR
+        board.first_child[self._node] = first
+
+        # the same random choices as Block._generate_children, so that a seed
+        # produces the same board with either representation
+        for i in range(4):
+            board.colours[first + i] = random.randrange(4)
+
+        for child in self.children:
+            is_picked = random.random() < math.exp(-0.25 * self.level)
+            if child.smashable() and is_picked:
+                child.smash()
+            else:
+                board.colours[child._node] = random.randrange(0, 4)
+
+        return True
+
+    def swap(self, direction: int) -> bool:
+        """Swap the child Blocks of this Block.
+
+        If this Block has no children, do nothing. Otherwise, if <direction> is
+        1, swap vertically. If <direction> is 0, swap horizontally.
+
+        Return True iff the swap was performed.
+
+        Precondition: <direction> is either 0 or 1
+        """
+        if self._board.kinds[self._node] == LEAF:
+            return False
+
+        if direction == 1:
+            self._board.permute_children(self._node, [3, 2, 1, 0])
+        else:
+            self._board.permute_children(self._node, [1, 0, 3, 2])
+
+        return True
+
+    def rotate(self, direction: int) -> bool:
+        """Rotate this Block and all its descendants.
+
+        If this Block has no children, do nothing. If <direction> is 1, rotate
+        clockwise. If <direction> is 3, rotate counter-clockwise.
+
+        Return True iff the rotate was performed.
+
+        Precondition: <direction> is either 1 or 3.
+        """
+        board = self._board
+        if board.kinds[self._node] == LEAF:
+            return False
+
+        if direction == 1:
+            order = [1, 2, 3, 0]
+        else:
+            order = [3, 0, 1, 2]
+
+        pending = [self._node]
+        while len(pending) != 0:
+            node = pending.pop()
+            board.permute_children(node, order)
+            first = board.first_child[node]
+            for i in range(4):
+                if board.kinds[first + i] == PARENT:
+                    pending.append(first + i)
+
+        return True
+
+    def paint(self, colour: Tuple[int, int, int]) -> bool:
+        """Change this Block's colour iff it is a leaf at a level of max_depth
+        and its colour is different from <colour>.
+
+        Return True iff this Block's colour was changed.
+        """
+        if self.level != self.max_depth or self.colour == colour:
+            return False
+
+        self._board.colours[self._node] = COLOUR_LIST.index(colour)
+        return True
+
+    def combine(self) -> bool:
+        """Turn this Block into a leaf based on the majority colour of its
+        children.
+
+        If there is no majority colour, do nothing. If this block is not at a
+        level of max_depth - 1, or this block has no children, do nothing.
+
+        Return True iff this Block was turned into a leaf node.
+        """
+        board = self._board
+        if board.kinds[self._node] == LEAF or \
+                self.level != self.max_depth - 1:
+            return False
+
+        counts = [0] * len(COLOUR_LIST)
+        first = board.first_child[self._node]
+        for i in range(4):
+            counts[board.colours[first + i]] += 1
+
+        highest_count = max(counts)
+        if counts.count(highest_count) != 1:
+            return False
+
+        board.release_children(self._node)
+        board.colours[self._node] = counts.index(highest_count)
+        return True
+
+    def _restore(self, colour: Optional[Tuple[int, int, int]],
+                 children: List[LinearBlock], frame: int,
+                 colours: Optional[List[Tuple[int, int, int]]] = None) -> None:
+        """Give this Block <colour> and <children> again, as they were before a
+        smash or a combine, as in Block._restore.
+
+        <children> are the children this Block had before it was combined, or
+        [] to undo a smash, and <colours> are their colours. Their slots may
+        have been reused since, so they are given fresh slots with <colours>.
+        <frame> is always 0 for a LinearBlock.
+        """
+        board = self._board
+        if len(children) == 0:
+            if board.kinds[self._node] == PARENT:
+                board.release_children(self._node)
+            board.colours[self._node] = COLOUR_LIST.index(colour)
+        else:
+            first = board.allocate_children()
+            for i in range(4):
+                board.kinds[first + i] = LEAF
+                board.colours[first + i] = COLOUR_LIST.index(colours[i])
+                board.first_child[first + i] = NO_CHILD
+            board.kinds[self._node] = PARENT
+            board.colours[self._node] = NO_COLOUR
+            board.first_child[self._node] = first
+
+    def create_copy(self, shared: bool = False) -> LinearBlock:
+        """Return a new Block that is a deep copy of this Block.
+
+        The copy has its own storage, so changing it does not change this
+        Block. <shared> is accepted for compatibility with Block.create_copy:
+        copying a whole board is already a flat copy of its arrays.
+        """
+        board = self._board.copy_subtree(self._node, self.position, self.size,
+                                         self.level)
+        return LinearBlock(board)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'settings', 'array', 'zobrist'
+        ],
+        'max-attributes': 15,
+        'max-args': 6
+    })
@@ -20,17 +20,42 @@ Misha Schwartz, and Jaisie Sin.
 === Module Description ===
 
 This file contains the hierarchy of player classes.
+
+pygame is only imported by the functions that handle its events, so that the
+computer players can also play without it, as in simulation.py.
 """
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+import math
 import random
-import pygame
+import threading
+import time
+
+if TYPE_CHECKING:
+    import pygame
 
-from block import Block
-from goal import Goal, generate_goals
+from block import Block, MoveJournal, decode_board, encode_board
+from goal import Goal, generate_goals, SCORE_CACHE
 
 from actions import KEY_ACTION, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PAINT, COMBINE
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PAINT, COMBINE, PASS, ACTION_PENALTY
+from settings import COLOUR_LIST
+
+
+# The number of random blocks _random_move tries before it lists every move.
+_RANDOM_TRIES = 16
+
+# The weight of exploration against exploitation when an MCTSPlayer selects
+# the next move to follow in its search tree.
+_EXPLORATION = 1.4
+
+# What the value kept for a board in the transposition table of an
+# AdversarialPlayer is: the value itself, or a bound on it from below or above
+# found when the rest of the search did not need the value itself.
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
 
 
 def create_players(num_human: int, num_random: int, smart_players: List[int]) \
@@ -120,15 +145,20 @@ class Player:
         This player's number.
     goal:
         This player's assigned goal for the game.
+    turns_left:
+        The number of turns this player has left in the game, counting the
+        current one, or None if it is not known.
     """
     id: int
     goal: Goal
+    turns_left: Optional[int]
 
     def __init__(self, player_id: int, goal: Goal) -> None:
         """Initialize this Player.
         """
         self.goal = goal
         self.id = player_id
+        self.turns_left = None
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         """Return the block that is currently selected by the player.
@@ -142,6 +172,41 @@ class Player:
         """
         raise NotImplementedError
 
+    def is_ready(self) -> bool:
+        """Return True iff generate_move would try to find a move now, rather
+        than return None while this player waits for an event.
+        """
+        raise NotImplementedError
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as the event it waits for
+        does.
+        """
+        raise NotImplementedError
+
+    def thinks_in_background(self) -> bool:
+        """Return True iff the moves of this player should be generated on
+        another thread, so that the game can go on while it thinks.
+
+        By default, a player may think for a long time, so it does.
+        """
+        return True
+
+    def set_opponents(self, players: List[Player]) -> None:
+        """Tell this player about the other <players> in the game, in the order
+        they move after this player.
+
+        This does nothing, unless this player takes the moves of the others
+        into account.
+        """
+
+    def close(self) -> None:
+        """Release anything this player keeps to generate its moves, because
+        the game is over.
+
+        By default, there is nothing to release.
+        """
+
     def generate_move(self, board: Block) -> \
             Optional[Tuple[str, Optional[int], Block]]:
         """Return a potential move to make on the game board.
@@ -161,6 +226,14 @@ def _create_move(action: Tuple[str, Optional[int]], block: Block) -> \
     return action[0], action[1], block
 
 
+def _is_left_click(event: pygame.event.Event) -> bool:
+    """Return True iff <event> is a press of the left mouse button.
+    """
+    import pygame
+
+    return event.type == pygame.MOUSEBUTTONDOWN and event.button == 1
+
+
 class HumanPlayer(Player):
     """A human player.
     """
@@ -192,6 +265,8 @@ class HumanPlayer(Player):
 
         If no block is selected by the player, return None.
         """
+        import pygame
+
         mouse_pos = pygame.mouse.get_pos()
         block = _get_block(board, mouse_pos, self._level)
 
@@ -202,6 +277,8 @@ class HumanPlayer(Player):
         the mapping in KEY_ACTION, as well as the W and S keys for changing
         the level.
         """
+        import pygame
+
         if event.type == pygame.KEYDOWN:
             if event.key in KEY_ACTION:
                 self._desired_action = KEY_ACTION[event.key]
@@ -212,6 +289,22 @@ class HumanPlayer(Player):
                 self._level += 1
                 self._desired_action = None
 
+    def is_ready(self) -> bool:
+        """Return True iff the player has chosen an action.
+        """
+        return self._desired_action is not None
+
+    def proceed(self) -> None:
+        """Do nothing, since a human player makes its move when it chooses an
+        action with the keyboard.
+        """
+
+    def thinks_in_background(self) -> bool:
+        """Return False, since the move of a human player is read from the
+        mouse and the keyboard as soon as it is ready.
+        """
+        return False
+
     def generate_move(self, board: Block) -> \
             Optional[Tuple[str, Optional[int], Block]]:
         """Return the move that the player would like to perform. The move may
@@ -253,9 +346,19 @@ class RandomPlayer(Player):
     def process_event(self, event: pygame.event.Event) -> None:
         """Update this player based on the pygame event.
         """
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        if _is_left_click(event):
             self._proceed = True
 
+    def is_ready(self) -> bool:
+        """Return True iff the player has been told to make a move.
+        """
+        return self._proceed
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as a left click does.
+        """
+        self._proceed = True
+
     def generate_move(self, board: Block) -> \
             Optional[Tuple[str, Optional[int], Block]]:
         """Return a valid, randomly generated move.
@@ -264,32 +367,25 @@ class RandomPlayer(Player):
         performed on the <board>.
 
         This function does not mutate <board>.
-        """
-        # collect a list of actions applicable
-        actions = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL,
-                   SWAP_VERTICAL, SMASH, COMBINE, PAINT]
 
+        >>> from block import generate_board
+        >>> from goal import BlobGoal
+        >>> board = generate_board(3, 750, compact=True)
+        >>> player = RandomPlayer(0, BlobGoal(COLOUR_LIST[0]))
+        >>> player.proceed()
+        >>> player.generate_move(board) is not None
+        True
+        """
         if not self._proceed:
             return None  # Do not remove
 
-        # randomly generate a block
-        copy = board.create_copy()
-
-        unit_length = int(2 ** board.max_depth)
-        column = random.randrange(unit_length)
-        row = random.randrange(unit_length)
-        level = random.randrange(board.max_depth + 1)  # level <= max_depth
-
-        picked = _get_block(copy, (column, row), level)  # block from copy
-        block = _get_block(board, (column, row), level)  # block from the board
-
-        # randomly generate moves and apply to the block until find one fits
-        action = random.choice(actions)
-        while not _move(picked, action):
-            action = random.choice(actions)
+        # the move is only checked for being valid, and never made
+        move = _random_move(board, self.goal.colour)
 
         self._proceed = False  # Must set to False before returning!
-        return _create_move(action, block)
+        if move is None:
+            return _create_move(PASS, board)
+        return move
 
 
 class SmartPlayer(Player):
@@ -301,19 +397,58 @@ class SmartPlayer(Player):
     #   wait.
     # _difficulty:
     #   Indicating how difficult it is to play against this player.
+    # _exhaustive:
+    #   True iff every valid move is assessed, instead of <_difficulty> random
+    #   ones.
+    # _workers:
+    #   The number of processes the moves are assessed in, or 0 to assess them
+    #   in this process.
+    # _executor:
+    #   The pool of <_workers> processes, once it has been started, or None.
+    # _time_budget:
+    #   The number of milliseconds the player may spend assessing moves, or
+    #   None if it assesses moves as set by <_exhaustive> and <_difficulty>.
     #
     # == Representation Invariants concerning the private attributes ==
     #    _difficulty > 0
+    #    _workers >= 0
     _proceed: bool
     _difficulty: int
-
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    _exhaustive: bool
+    _workers: int
+    _executor: Optional[ProcessPoolExecutor]
+    _time_budget: Optional[int]
+
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 exhaustive: bool = False, workers: int = 0,
+                 time_budget: Optional[int] = None) -> None:
         """Initialize this SmartPlayer with the given <player_id> and <goal>.
+
+        If <exhaustive> is True, the player assesses every valid move on the
+        board instead of <difficulty> random ones. If <workers> is more than
+        0, the moves are assessed in that many other processes.
+
+        If <time_budget> is not None, the player instead assesses the valid
+        moves on the board in this process, moves on bigger blocks first,
+        until <time_budget> milliseconds have passed, and chooses the best move
+        it has found by then.
         """
         Player.__init__(self, player_id, goal)
         self._difficulty = difficulty
+        self._exhaustive = exhaustive
+        self._workers = workers
+        self._executor = None
+        self._time_budget = time_budget
         self._proceed = False
 
+    def close(self) -> None:
+        """Shut down the processes the moves are assessed in, if they were
+        started.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
     def get_selected_block(self, board: Block) -> Optional[Block]:
         """No block is selected by the player, return None.
         """
@@ -322,9 +457,19 @@ class SmartPlayer(Player):
     def process_event(self, event: pygame.event.Event) -> None:
         """Update this player based on the pygame event.
         """
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        if _is_left_click(event):
             self._proceed = True
 
+    def is_ready(self) -> bool:
+        """Return True iff the player has been told to make a move.
+        """
+        return self._proceed
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as a left click does.
+        """
+        self._proceed = True
+
     def generate_move(self, board: Block) -> \
             Optional[Tuple[str, Optional[int], Block]]:
         """Return a valid move by assessing multiple valid moves and choosing
@@ -335,53 +480,1147 @@ class SmartPlayer(Player):
         performed on the <board>. If no move can be found that is better than
         the current score, this player will pass.
 
+        Each move is assessed by making it on <board>, scoring the board and
+        undoing it. When several moves give the highest score, the first one
+        assessed is chosen. A smash is assessed on one random outcome, since
+        the blocks it creates are random.
+
         This function does not mutate <board>.
+
+        >>> from block import generate_board
+        >>> from goal import BlobGoal
+        >>> board = generate_board(3, 750, compact=True)
+        >>> before = str(board)
+        >>> goal = BlobGoal(COLOUR_LIST[0])
+        >>> for player in [SmartPlayer(0, goal, 5),
+        ...                SmartPlayer(0, goal, 5, exhaustive=True),
+        ...                SmartPlayer(0, goal, 5, time_budget=50)]:
+        ...     player.proceed()
+        ...     _ = player.generate_move(board)
+        >>> str(board) == before
+        True
         """
         if not self._proceed:
             return None  # Do not remove
 
-        scores = {}
+        if self._time_budget is not None:
+            deadline = time.monotonic() + self._time_budget / 1000
+            best_move, highest = _best_move(
+                board, self.goal, _legal_moves(board, self.goal.colour),
+                deadline)
+        else:
+            if self._exhaustive:
+                moves = _legal_moves(board, self.goal.colour)
+            else:
+                moves = self._sample_moves(board)
+
+            if self._workers > 0:
+                best_move, highest = self._best_move_in_parallel(board,
+                                                                 list(moves))
+            else:
+                best_move, highest = _best_move(board, self.goal, moves)
+
+        self._proceed = False  # before return
+
+        # compare it to the current score of the current board
+        # if it is better with no move made, or there is no valid move, pass
+        if best_move is None or \
+                highest < SCORE_CACHE.score(self.goal, board):
+            return None
+
+        # if the move increase the score, make the move
+        return best_move
+
+    def _sample_moves(self, board: Block) -> \
+            Iterator[Tuple[str, Optional[int], Block]]:
+        """Yield <_difficulty> valid, randomly generated moves on <board>.
+
+        Different samples often lead to the same board, and the scores of
+        boards that were seen before are looked up in SCORE_CACHE.
+        """
         for _ in range(self._difficulty):
-            copy = board.create_copy()
-            helper = RandomPlayer(0, self.goal)
+            move = _random_move(board, self.goal.colour)
+            if move is None:
+                return
+            yield move
+
+    def _best_move_in_parallel(self, board: Block,
+                               moves: List[Tuple[str, Optional[int], Block]]) \
+            -> Tuple[Optional[Tuple[str, Optional[int], Block]], int]:
+        """Return the same as _best_move(board, self.goal, moves), assessing
+        the moves in <_workers> other processes.
+
+        Each process is sent <board> once, encoded by encode_board, with its
+        share of the moves, each given by the path to its block and its
+        action. Only the scores are sent back.
+        """
+        if len(moves) == 0:
+            return None, 0
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+
+        described = [(_block_path(board, block), action, direction)
+                     for action, direction, block in moves]
+        encoded = encode_board(board)
+        share = -(-len(described) // self._workers)
+        futures = [self._executor.submit(_score_moves, encoded,
+                                         type(self.goal), self.goal.colour,
+                                         described[i:i + share])
+                   for i in range(0, len(described), share)]
+
+        best_move = None
+        highest = 0
+        scores = [score for future in futures for score in future.result()]
+        for move, score in zip(moves, scores):
+            if best_move is None or score > highest:
+                best_move = move
+                highest = score
+
+        return best_move, highest
+
+
+class MCTSPlayer(Player):
+    """A player who chooses its moves by Monte Carlo tree search, planning
+    several of its own moves ahead and taking penalties into account.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _rollouts:
+    #   The number of rollouts the player makes to choose a move.
+    # _horizon:
+    #   The most moves of its own the player plans ahead.
+    # _time_budget:
+    #   The number of milliseconds the player may spend on its rollouts, or
+    #   None if only <_rollouts> limits them.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #    _rollouts > 0
+    #    _horizon > 0
+    _proceed: bool
+    _rollouts: int
+    _horizon: int
+    _time_budget: Optional[int]
 
-            # use the random player to generate a valid move
-            helper._proceed = True
-            move = helper.generate_move(copy)  # (action, block from copy)
+    def __init__(self, player_id: int, goal: Goal, rollouts: int,
+                 horizon: int = 4, time_budget: Optional[int] = None) -> None:
+        """Initialize this MCTSPlayer with the given <player_id> and <goal>.
 
-            # make the move on the copy
-            _move(move[-1], move[:-1])
+        The player makes <rollouts> rollouts to choose each move, or as many as
+        it can in <time_budget> milliseconds if that is fewer, and plans at
+        most <horizon> of its moves ahead.
+        """
+        Player.__init__(self, player_id, goal)
+        self._rollouts = rollouts
+        self._horizon = horizon
+        self._time_budget = time_budget
+        self._proceed = False
 
-            # record the score of the copy
-            score = self.goal.score(copy)
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        """No block is selected by the player, return None.
+        """
+        return None
 
-            # collect all scores into a dictionary
-            scores[score] = move  # (action, block from copy)
+    def process_event(self, event: pygame.event.Event) -> None:
+        """Update this player based on the pygame event.
+        """
+        if _is_left_click(event):
+            self._proceed = True
+
+    def is_ready(self) -> bool:
+        """Return True iff the player has been told to make a move.
+        """
+        return self._proceed
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as a left click does.
+        """
+        self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move that leads to the highest score for this player's
+        goal minus the penalties of the moves made, over the next few moves of
+        this player, as estimated by Monte Carlo tree search.
+
+        The search plans <_horizon> moves ahead, or the number of turns this
+        player has left if that is fewer, and ignores the moves of the other
+        players. Each rollout follows the moves in the search tree and then
+        makes random moves up to the horizon, and is worth the best score minus
+        penalties it reached, since the player could pass from then on. The
+        move returned may be PASS.
+
+        This function does not mutate <board>.
+
+        >>> from block import generate_board
+        >>> from goal import BlobGoal
+        >>> board = generate_board(3, 750, compact=True)
+        >>> player = MCTSPlayer(0, BlobGoal(COLOUR_LIST[0]), 50)
+        >>> player.proceed()
+        >>> player.generate_move(board) is not None
+        True
+        """
+        if not self._proceed:
+            return None  # Do not remove
 
-        # find the highest score that is generated among all valid moves
-        highest = max(scores)
+        horizon = self._horizon
+        if self.turns_left is not None:
+            horizon = max(1, min(horizon, self.turns_left))
 
+        deadline = None
+        if self._time_budget is not None:
+            deadline = time.monotonic() + self._time_budget / 1000
+
+        search = _TreeSearch(board, self.goal, horizon)
+        for i in range(self._rollouts):
+            if deadline is not None and i > 0 and time.monotonic() >= deadline:
+                break
+            search.rollout()
+
+        path, action = search.best_move()
         self._proceed = False  # before return
+        return _create_move(action, _block_at(board, path))
 
-        # compare it to the current score of the current board
-        # if it is better with no move made, pass
-        if highest < self.goal.score(board):
+
+class BeamSearchPlayer(Player):
+    """A player who chooses its moves by a beam search over sequences of its
+    own moves, taking penalties into account.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _depth:
+    #   The most moves of its own the player plans ahead.
+    # _width:
+    #   The number of boards kept after each move of the search.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #    _depth > 0
+    #    _width > 0
+    _proceed: bool
+    _depth: int
+    _width: int
+
+    def __init__(self, player_id: int, goal: Goal, depth: int = 3,
+                 width: int = 4) -> None:
+        """Initialize this BeamSearchPlayer with the given <player_id> and
+        <goal>, which plans up to <depth> moves ahead and keeps the <width>
+        best boards after each of them.
+        """
+        Player.__init__(self, player_id, goal)
+        self._depth = depth
+        self._width = width
+        self._proceed = False
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        """No block is selected by the player, return None.
+        """
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        """Update this player based on the pygame event.
+        """
+        if _is_left_click(event):
+            self._proceed = True
+
+    def is_ready(self) -> bool:
+        """Return True iff the player has been told to make a move.
+        """
+        return self._proceed
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as a left click does.
+        """
+        self._proceed = True
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the first move of the best sequence of moves found by a beam
+        search, where a sequence is worth the score for this player's goal on
+        the board it leads to minus the penalties of its moves.
+
+        The search plans <_depth> moves ahead, or the number of turns this
+        player has left if that is fewer, and ignores the moves of the other
+        players. If no sequence is worth more than the current score, the move
+        returned is PASS.
+
+        This function does not mutate <board>.
+
+        >>> from block import generate_board
+        >>> from goal import BlobGoal
+        >>> board = generate_board(3, 750, compact=True)
+        >>> player = BeamSearchPlayer(0, BlobGoal(COLOUR_LIST[0]), 2, 3)
+        >>> player.proceed()
+        >>> player.generate_move(board) is not None
+        True
+        """
+        if not self._proceed:
+            return None  # Do not remove
+
+        depth = self._depth
+        if self.turns_left is not None:
+            depth = max(1, min(depth, self.turns_left))
+
+        path, action = _beam_search(board, self.goal, depth, self._width)
+        self._proceed = False  # before return
+        return _create_move(action, _block_at(board, path))
+
+
+class AdversarialPlayer(Player):
+    """A player who chooses its moves by searching its own moves together with
+    the replies of the other players, as modelled by their goals.
+
+    === Public Attributes ===
+    opponents:
+        The other players in the game, in the order they move after this
+        player.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _depth:
+    #   The most moves of its own the player searches, each followed by a
+    #   reply from every opponent.
+    # _width:
+    #   The number of its own moves searched on each board, those that lead to
+    #   the highest score minus penalty first.
+    # _replies:
+    #   The number of moves searched for an opponent who is not a
+    #   RandomPlayer, those that are best for the opponent's goal first.
+    # _samples:
+    #   The number of random moves searched for an opponent who is a
+    #   RandomPlayer.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #    _depth > 0
+    #    _width > 0
+    #    _replies > 0
+    #    _samples > 0
+    opponents: List[Player]
+    _proceed: bool
+    _depth: int
+    _width: int
+    _replies: int
+    _samples: int
+
+    def __init__(self, player_id: int, goal: Goal, depth: int = 1,
+                 width: int = 6, replies: int = 2, samples: int = 4) -> None:
+        """Initialize this AdversarialPlayer with the given <player_id> and
+        <goal>, and no opponents.
+
+        The player searches up to <depth> of its own moves, <width> of them on
+        each board, and <replies> or, for a RandomPlayer, <samples> moves of
+        each opponent after each of them.
+        """
+        Player.__init__(self, player_id, goal)
+        self.opponents = []
+        self._depth = depth
+        self._width = width
+        self._replies = replies
+        self._samples = samples
+        self._proceed = False
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        """No block is selected by the player, return None.
+        """
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        """Update this player based on the pygame event.
+        """
+        if _is_left_click(event):
+            self._proceed = True
+
+    def is_ready(self) -> bool:
+        """Return True iff the player has been told to make a move.
+        """
+        return self._proceed
+
+    def proceed(self) -> None:
+        """Tell this player to make its next move, as a left click does.
+        """
+        self._proceed = True
+
+    def set_opponents(self, players: List[Player]) -> None:
+        """Search the replies of the other <players> in the game, in the order
+        they move after this player.
+        """
+        self.opponents = players
+
+    def generate_move(self, board: Block) -> \
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move that leads to the highest score for this player's
+        goal minus the penalties of its moves, after the other players reply,
+        as found by searching the moves of every player in turn.
+
+        An opponent who is a RandomPlayer is expected to make any of a few
+        random moves with equal chances (expectimax). Any other opponent is
+        expected to make one of its best moves for its own goal, whichever is
+        worst for this player, and those moves are searched with alpha-beta
+        pruning. The boards seen more than once in the search are looked up in
+        a transposition table. The move returned may be PASS.
+
+        This function does not mutate <board>.
+
+        >>> from block import generate_board
+        >>> from goal import BlobGoal
+        >>> board = generate_board(3, 750, compact=True)
+        >>> player = AdversarialPlayer(0, BlobGoal(COLOUR_LIST[0]), 1, 3)
+        >>> player.set_opponents([RandomPlayer(1, BlobGoal(COLOUR_LIST[1]))])
+        >>> player.proceed()
+        >>> player.generate_move(board) is not None
+        True
+        """
+        if not self._proceed:
+            return None  # Do not remove
+
+        depth = self._depth
+        if self.turns_left is not None:
+            depth = max(1, min(depth, self.turns_left))
+
+        search = _AdversarialSearch(board, self.goal,
+                                    [(opponent.goal,
+                                      isinstance(opponent, RandomPlayer))
+                                     for opponent in self.opponents],
+                                    (self._width, self._replies,
+                                     self._samples))
+        path, action = search.best_move(depth)
+        self._proceed = False  # before return
+        return _create_move(action, _block_at(board, path))
+
+
+class BackgroundMove:
+    """A move that a player is generating on another thread, so that the game
+    can go on rendering and handling events in the meantime.
+
+    The player generates its move on a copy of the board, since the game reads
+    the board while it does, and the move is given on the board itself. The
+    thread is a daemon thread, so a move that is cancelled because the game is
+    closed does not keep the program running.
+    """
+    # === Private Attributes ===
+    # _board:
+    #   The board the move is for.
+    # _copy:
+    #   The copy of <_board> the player generates its move on.
+    # _thread:
+    #   The thread the player generates its move on.
+    # _move:
+    #   The move generated on <_copy>, or None if there is none yet.
+    # _cancelled:
+    #   True iff the move is no longer wanted.
+    _board: Block
+    _copy: Block
+    _thread: threading.Thread
+    _move: Optional[Tuple[str, Optional[int], Block]]
+    _cancelled: bool
+
+    def __init__(self, player: Player, board: Block) -> None:
+        """Start generating the move of <player> on <board>.
+
+        Neither <board> nor <player> may be changed until the move is done.
+        """
+        self._board = board
+        self._copy = board.create_copy()
+        self._move = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._generate,
+                                        args=(player,), daemon=True)
+        self._thread.start()
+
+    def _generate(self, player: Player) -> None:
+        """Generate the move of <player> on the copy of the board.
+        """
+        self._move = player.generate_move(self._copy)
+
+    def done(self) -> bool:
+        """Return True iff the player has finished generating its move.
+        """
+        return not self._thread.is_alive()
+
+    def result(self) -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move the player generated, on the board, or None if it
+        generated no move or the move was cancelled.
+
+        Precondition: self.done()
+        """
+        if self._cancelled or self._move is None:
             return None
+        action, direction, block = self._move
+        return action, direction, _block_at(self._board,
+                                            _block_path(self._copy, block))
 
-        # if the move increase the score, prepare to make the move
-        # find the block on board corresponding to the one from copy
-        copied_block = scores[highest][-1]
-        location = copied_block.position
-        level = copied_block.level
-        block = _get_block(board, location, level)
+    def cancel(self) -> None:
+        """Give up on the move.
+
+        The player cannot be interrupted, so it goes on generating the move,
+        but the move is thrown away.
+        """
+        self._cancelled = True
 
-        return _create_move(scores[highest][:-1], block)
 
+class _AdversarialSearch:
+    """A search of the moves of a player and of the replies of its opponents
+    on a board, for the move that is best for the player's goal.
 
-def _move(block: Block, action: Tuple[str, Optional[int]]) -> bool:
+    The value of a board is the score of the player's goal on the board at the
+    end of the search, minus the penalties of the player's moves from that
+    board on. The moves are made on the board itself through a MoveJournal,
+    and undone when they have been searched.
+    """
+    # === Private Attributes ===
+    # _board:
+    #   The board the search is for.
+    # _goals:
+    #   The goal of each player, in the order they move, starting with the
+    #   player the search is for.
+    # _random:
+    #   Whether each player, in the same order, is a RandomPlayer.
+    # _width, _replies, _samples:
+    #   As in AdversarialPlayer.
+    # _journal:
+    #   The journal the moves are made through.
+    # _table:
+    #   The transposition table: the value of each board searched, or a bound
+    #   on it as given by _EXACT, _LOWER or _UPPER, by its structural_hash, the
+    #   player whose turn it is and the number of moves the first player has
+    #   left.
+    # _orders:
+    #   The moves searched on each board for the player whose turn it is, best
+    #   first, by its structural_hash and that player.
+    _board: Block
+    _goals: List[Goal]
+    _random: List[bool]
+    _width: int
+    _replies: int
+    _samples: int
+    _journal: MoveJournal
+    _table: Dict[Tuple[int, int, int], Tuple[float, int]]
+    _orders: Dict[Tuple[int, int],
+                  List[Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]]]
+
+    def __init__(self, board: Block, goal: Goal,
+                 opponents: List[Tuple[Goal, bool]],
+                 limits: Tuple[int, int, int]) -> None:
+        """Initialize a search on <board> for <goal> against <opponents>, each
+        given by its goal and whether it is a RandomPlayer, in the order they
+        move, where <limits> are the width, replies and samples of the search.
+        """
+        self._board = board
+        self._goals = [goal] + [opponent[0] for opponent in opponents]
+        self._random = [False] + [opponent[1] for opponent in opponents]
+        self._width, self._replies, self._samples = limits
+        self._journal = MoveJournal()
+        self._table = {}
+        self._orders = {}
+
+    def best_move(self, depth: int) -> \
+            Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]:
+        """Return the best move for the first player when it searches <depth>
+        of its moves, as the path to its block and its action.
+        """
+        return self._max_value(depth, -math.inf, math.inf)[1]
+
+    def _value(self, turn: int, depth: int, alpha: float,
+               beta: float) -> float:
+        """Return the value of the board when it is the turn of the player at
+        index <turn> and the first player has <depth> moves left.
+
+        If the value is at most <alpha> or at least <beta>, a number that is
+        also at most <alpha> or at least <beta>, respectively, may be returned
+        instead.
+        """
+        if turn == 0 and depth == 0:
+            return SCORE_CACHE.score(self._goals[0], self._board)
+
+        key = (self._board.structural_hash(), turn, depth)
+        if key in self._table:
+            value, kind = self._table[key]
+            if kind == _EXACT or (kind == _LOWER and value >= beta) or \
+                    (kind == _UPPER and value <= alpha):
+                return value
+
+        if turn == 0:
+            value = self._max_value(depth, alpha, beta)[0]
+        elif self._random[turn]:
+            value = self._chance_value(turn, depth)
+            alpha, beta = -math.inf, math.inf
+        else:
+            value = self._min_value(turn, depth, alpha, beta)
+
+        if value <= alpha:
+            self._table[key] = (value, _UPPER)
+        elif value >= beta:
+            self._table[key] = (value, _LOWER)
+        else:
+            self._table[key] = (value, _EXACT)
+        return value
+
+    def _max_value(self, depth: int, alpha: float, beta: float) -> \
+            Tuple[float, Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]]:
+        """Return the value of the board when it is the first player's turn
+        and it has <depth> moves left, as in _value, and the move that gives
+        it.
+        """
+        best_move = ((), PASS)
+        highest = -math.inf
+        for move in self._ordered_moves(0)[:self._width]:
+            penalty = ACTION_PENALTY[move[1]]
+            value = self._child_value(move, 0, depth - 1, alpha + penalty,
+                                      beta + penalty) - penalty
+            if value > highest:
+                best_move = move
+                highest = value
+            alpha = max(alpha, highest)
+            if alpha >= beta:
+                break
+        return highest, best_move
+
+    def _min_value(self, turn: int, depth: int, alpha: float,
+                   beta: float) -> float:
+        """Return the value of the board when it is the turn of the opponent at
+        index <turn>, who is not a RandomPlayer, as in _value.
+        """
+        lowest = math.inf
+        for move in self._ordered_moves(turn)[:self._replies]:
+            lowest = min(lowest, self._child_value(move, turn, depth, alpha,
+                                                   beta))
+            beta = min(beta, lowest)
+            if alpha >= beta:
+                break
+        return lowest
+
+    def _chance_value(self, turn: int, depth: int) -> float:
+        """Return the value of the board when it is the turn of the opponent at
+        index <turn>, who is a RandomPlayer, as the average value after a few
+        of its random moves.
+        """
+        total = 0
+        for _ in range(self._samples):
+            move = _random_move(self._board, self._goals[turn].colour)
+            if move is None:
+                described = ((), PASS)
+            else:
+                described = (_block_path(self._board, move[2]),
+                             (move[0], move[1]))
+            total += self._child_value(described, turn, depth, -math.inf,
+                                       math.inf)
+        return total / self._samples
+
+    def _child_value(self, move: Tuple[Tuple[int, ...],
+                                       Tuple[str, Optional[int]]],
+                     turn: int, depth: int, alpha: float,
+                     beta: float) -> float:
+        """Return the value of the board after the player at index <turn>
+        makes <move>, with the first player left with <depth> moves, as in
+        _value.
+        """
+        savepoint = self._journal.savepoint()
+        if move[1] != PASS:
+            _move(_block_at(self._board, move[0]), move[1], self._journal,
+                  self._goals[turn].colour)
+        value = self._value((turn + 1) % len(self._goals), depth, alpha, beta)
+        self._journal.rollback(savepoint)
+        return value
+
+    def _ordered_moves(self, turn: int) -> \
+            List[Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]]:
+        """Return PASS and every valid move, as in _legal_moves, of the player
+        at index <turn> on the board, as the path to its block and its action,
+        in decreasing order of the score for that player's goal minus the
+        penalty of the move.
+
+        Each move is scored by making it and undoing it.
+        """
+        key = (self._board.structural_hash(), turn)
+        if key in self._orders:
+            return self._orders[key]
+
+        goal = self._goals[turn]
+        scored = [(SCORE_CACHE.score(goal, self._board), ((), PASS))]
+        for action, direction, block in _legal_moves(self._board,
+                                                     goal.colour):
+            path = _block_path(self._board, block)
+            savepoint = self._journal.savepoint()
+            _move(block, (action, direction), self._journal, goal.colour)
+            scored.append((SCORE_CACHE.score(goal, self._board) -
+                           ACTION_PENALTY[(action, direction)],
+                           (path, (action, direction))))
+            self._journal.rollback(savepoint)
+
+        scored.sort(key=lambda item: -item[0])
+        self._orders[key] = [move for _, move in scored]
+        return self._orders[key]
+
+
+class _SearchNode:
+    """A node in the search tree of an MCTSPlayer, for a sequence of moves made
+    from the board the search started on.
+
+    === Public Attributes ===
+    visits:
+        The number of rollouts that went through this node.
+    total:
+        The sum of the values of those rollouts.
+    children:
+        The nodes for the moves that have been tried after the moves of this
+        node, by the path to the block of the move and its action.
+    """
+    visits: int
+    total: float
+    children: Dict[Tuple[Tuple[int, ...], Tuple[str, Optional[int]]],
+                   _SearchNode]
+
+    def __init__(self) -> None:
+        """Initialize a node that no rollout has gone through yet.
+        """
+        self.visits = 0
+        self.total = 0
+        self.children = {}
+
+
+class _TreeSearch:
+    """A Monte Carlo tree search for the best move for a goal on a board.
+
+    Each rollout makes its moves on the board itself through a MoveJournal,
+    and undoes them before the next one. A move is kept in the tree as the path
+    to its block and its action rather than the block, since a block may be
+    replaced by an equal one when the moves above it are made again. Each
+    node gains children as it is visited more often, from random moves, so
+    that a rollout never has to list every move on the board.
+
+    A smash has a random outcome, so the moves below it in the tree may not be
+    possible on the board in a later rollout; a rollout stops at such a move.
+    """
+    # === Private Attributes ===
+    # _board:
+    #   The board the search is for.
+    # _goal:
+    #   The goal that the moves are scored for.
+    # _horizon:
+    #   The number of moves that each rollout makes.
+    # _journal:
+    #   The journal the moves of a rollout are made through.
+    # _root:
+    #   The node for no moves made.
+    # _low, _high:
+    #   The lowest and highest value of a rollout so far, which the values are
+    #   scaled by when selecting a move.
+    _board: Block
+    _goal: Goal
+    _horizon: int
+    _journal: MoveJournal
+    _root: _SearchNode
+    _low: float
+    _high: float
+
+    def __init__(self, board: Block, goal: Goal, horizon: int) -> None:
+        """Initialize a search on <board> for <goal> of <horizon> moves.
+        """
+        self._board = board
+        self._goal = goal
+        self._horizon = horizon
+        self._journal = MoveJournal()
+        self._root = _SearchNode()
+        self._low = math.inf
+        self._high = -math.inf
+
+    def best_move(self) -> Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]:
+        """Return the move from the root that the most rollouts went through,
+        as the path to its block and its action, or PASS if there is none.
+        """
+        best = ((), PASS)
+        visits = 0
+        for move, child in self._root.children.items():
+            if child.visits > visits:
+                best = move
+                visits = child.visits
+        return best
+
+    def rollout(self) -> None:
+        """Make one rollout from the root and record its value in the nodes
+        that it went through.
+        """
+        node = self._root
+        nodes = [node]
+        penalty = 0
+        moves_left = self._horizon
+        while moves_left > 0:
+            move, is_new = self._select(node)
+            if move[1] == PASS:
+                nodes.append(node.children[move])
+                moves_left = 0
+                break
+
+            block = _block_at(self._board, move[0])
+            if block is None or not _move(block, move[1], self._journal,
+                                          self._goal.colour):
+                # the move is not possible after the smashes made this time
+                if is_new:
+                    del node.children[move]
+                break
+
+            penalty += ACTION_PENALTY[move[1]]
+            moves_left -= 1
+            node = node.children[move]
+            nodes.append(node)
+            if is_new:
+                break
+
+        value = SCORE_CACHE.score(self._goal, self._board) - penalty
+        for _ in range(moves_left):
+            action, direction, block = _quick_move(self._board)
+            if _move(block, (action, direction), self._journal,
+                     self._goal.colour):
+                penalty += ACTION_PENALTY[(action, direction)]
+                value = max(value,
+                            SCORE_CACHE.score(self._goal, self._board) -
+                            penalty)
+        self._journal.rollback()
+
+        self._low = min(self._low, value)
+        self._high = max(self._high, value)
+        for node in nodes:
+            node.visits += 1
+            node.total += value
+
+    def _select(self, node: _SearchNode) -> \
+            Tuple[Tuple[Tuple[int, ...], Tuple[str, Optional[int]]], bool]:
+        """Return the move to follow from <node>, and whether it was just added
+        to the children of <node>.
+
+        Passing is tried first. Then a random move is added whenever <node> has
+        fewer than one child more than the square root of its visits, and
+        otherwise the child with the best UCB1 value is followed.
+        """
+        if len(node.children) == 0:
+            move = ((), PASS)
+            node.children[move] = _SearchNode()
+            return move, True
+
+        if len(node.children) <= math.sqrt(node.visits):
+            move = _random_move(self._board, self._goal.colour)
+            if move is not None:
+                described = (_block_path(self._board, move[2]),
+                             (move[0], move[1]))
+                if described not in node.children:
+                    node.children[described] = _SearchNode()
+                    return described, True
+
+        spread = max(self._high - self._low, 1)
+        log_visits = math.log(node.visits)
+        best = None
+        highest = -math.inf
+        for move, child in node.children.items():
+            value = (child.total / child.visits - self._low) / spread + \
+                _EXPLORATION * math.sqrt(log_visits / child.visits)
+            if value > highest:
+                best = move
+                highest = value
+        return best, False
+
+
+def _score_moves(encoded: bytes, goal_type: type,
+                 colour: Tuple[int, int, int],
+                 moves: List[Tuple[Tuple[int, ...], str, Optional[int]]]) -> \
+        List[int]:
+    """Return the score of a goal of <goal_type> and <colour> on the board
+    encoded in <encoded> after each move in <moves>, in order.
+
+    Each move is given by the path to its block, as in _block_path, and its
+    action and direction. This runs in another process.
+    """
+    board = decode_board(encoded)
+    goal = goal_type(colour)
+    journal = MoveJournal()
+
+    scores = []
+    for path, action, direction in moves:
+        block = board
+        for i in path:
+            block = block.children[i]
+        _move(block, (action, direction), journal, colour)
+        scores.append(goal.score(board))
+        journal.rollback()
+
+    return scores
+
+
+def _best_move(board: Block, goal: Goal,
+               moves: Iterator[Tuple[str, Optional[int], Block]],
+               deadline: Optional[float] = None) -> \
+        Tuple[Optional[Tuple[str, Optional[int], Block]], int]:
+    """Return the move in <moves> that results in the highest score for <goal>
+    on <board>, and that score, or (None, 0) if there are no moves.
+
+    Each move is made on <board> itself, scored and undone, so <board> ends up
+    unchanged, and the first of several moves with the highest score is
+    returned. A paint uses the colour of <goal>, as in the game.
+
+    If <deadline> is not None, no more moves are assessed once
+    time.monotonic() reaches it, except that at least one move is.
+    """
+    journal = MoveJournal()
+    best_move = None
+    highest = 0
+    for move in moves:
+        if deadline is not None and best_move is not None and \
+                time.monotonic() >= deadline:
+            break
+
+        _move(move[2], (move[0], move[1]), journal, goal.colour)
+        score = SCORE_CACHE.score(goal, board)
+        journal.rollback()
+
+        if best_move is None or score > highest:
+            best_move = move
+            highest = score
+
+    return best_move, highest
+
+
+def _beam_search(board: Block, goal: Goal, depth: int, width: int) -> \
+        Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]:
+    """Return the first move of the best sequence of at most <depth> moves on
+    <board> for <goal> found by a beam search of <width>, as the path to its
+    block and its action, or PASS if no sequence is better than no move.
+
+    A sequence is worth the score of <goal> on the board it leads to minus the
+    penalties of its moves. Every valid move, as in _legal_moves, is assessed
+    on each board kept after the previous move, by making it on that board,
+    scoring it and undoing it. Of the boards that the moves lead to, equal ones
+    by structural_hash are merged, keeping the best sequence to them, and the
+    <width> best are kept, each as a shared copy with the move made on it.
+
+    Boards and moves that cannot lead to a sequence worth more than the best
+    one so far, by the upper_bound of <goal>, are skipped. A smash is assessed
+    on one random outcome, and the board kept for it has another one. Nothing
+    is changed.
+    """
+    journal = MoveJournal()
+    best_first = ((), PASS)
+    highest = SCORE_CACHE.score(goal, board)
+
+    # each board kept, with the first move and the total penalty of the moves
+    # that led to it
+    beam = [(board, best_first, 0)]
+    for step in range(depth):
+        candidates = {}
+        for i, (current, _, penalty) in enumerate(beam):
+            bound = goal.upper_bound(current, depth - step)
+            if bound - penalty <= highest:
+                continue
+
+            for action, direction, block in _legal_moves(current, goal.colour):
+                total_penalty = penalty + ACTION_PENALTY[(action, direction)]
+                if bound - total_penalty <= highest:
+                    continue
+
+                path = _block_path(current, block)
+                _move(block, (action, direction), journal, goal.colour)
+                value = SCORE_CACHE.score(goal, current) - total_penalty
+                key = current.structural_hash()
+                journal.rollback()
+
+                if key not in candidates or value > candidates[key][0]:
+                    candidates[key] = (value, i, path, (action, direction),
+                                       total_penalty)
+
+        ranked = sorted(candidates.values(), key=lambda c: -c[0])[:width]
+        next_beam = []
+        for value, i, path, action, total_penalty in ranked:
+            current, first, _ = beam[i]
+            if step == 0:
+                first = (path, action)
+            if value > highest:
+                best_first = first
+                highest = value
+
+            if step < depth - 1:
+                copy = current.create_copy(shared=True)
+                _move(_block_at(copy, path), action, None, goal.colour)
+                next_beam.append((copy, first, total_penalty))
+        beam = next_beam
+
+    return best_first
+
+
+def _block_moves(block: Block, colour: Tuple[int, int, int]) -> \
+        List[Tuple[str, Optional[int]]]:
+    """Return the actions that can be successfully performed on <block>, for a
+    player whose goal has <colour>, leaving out the ones that would not change
+    the board and the ones that would have the same result as another one.
+
+    A paint is performed with <colour>, as the game does. Nothing is changed.
+
+    >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> _block_moves(block, COLOUR_LIST[1])
+    [('smash', None)]
+    >>> block.children = [Block(position, 375, COLOUR_LIST[0], 1, 1)
+    ...                   for position in block._children_positions()]
+    >>> block.colour = None
+    >>> _block_moves(block, COLOUR_LIST[1])
+    [('combine', None)]
+    """
+    actions = []
+    if len(block.children) != 0:
+        # a rotation or swap that maps every child onto an equal one changes
+        # nothing, and half a turn that changes nothing makes the two
+        # rotations the same
+        if block.symmetry_hash(1) != block.symmetry_hash(0):
+            actions.append(ROTATE_CLOCKWISE)
+            if block.symmetry_hash(2) != block.symmetry_hash(0):
+                actions.append(ROTATE_COUNTER_CLOCKWISE)
+
+        keys = [child.structural_hash() for child in block.children]
+        if keys[0] != keys[1] or keys[2] != keys[3]:
+            actions.append(SWAP_HORIZONTAL)
+        if keys[0] != keys[3] or keys[1] != keys[2]:
+            actions.append(SWAP_VERTICAL)
+
+        if block.level == block.max_depth - 1:
+            counts = block.colour_counts()
+            if counts.count(max(counts)) == 1:
+                actions.append(COMBINE)
+    elif block.level != block.max_depth:
+        actions.append(SMASH)
+    elif block.colour != colour:
+        actions.append(PAINT)
+
+    return actions
+
+
+def _legal_moves(board: Block, colour: Tuple[int, int, int]) -> \
+        Iterator[Tuple[str, Optional[int], Block]]:
+    """Yield every distinct move that can be successfully performed on
+    <board> by a player whose goal has <colour>, once each, as described in
+    _block_moves.
+
+    The moves are yielded level by level, so that the moves on bigger blocks,
+    which can change more of the board, come first. The moves are made of the
+    blocks of <board> itself, so a move may be made and undone with a
+    MoveJournal before the next one is taken.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+    >>> list(_legal_moves(board, COLOUR_LIST[1])) == [('smash', None, board)]
+    True
+    """
+    level_blocks = [board]
+    while len(level_blocks) != 0:
+        next_blocks = []
+        for block in level_blocks:
+            for action in _block_moves(block, colour):
+                yield _create_move(action, block)
+            next_blocks.extend(block.children)
+        level_blocks = next_blocks
+
+
+def _random_move(board: Block, colour: Tuple[int, int, int]) -> \
+        Optional[Tuple[str, Optional[int], Block]]:
+    """Return a randomly chosen move that can be successfully performed on
+    <board> by a player whose goal has <colour>, as described in
+    _block_moves, or None if there is no such move.
+
+    A block is chosen by picking a random location and level, and then one of
+    the moves on that block. Nothing is copied or changed.
+    """
+    # a random block only has no moves when it is a unit cell of <colour>, so
+    # a few tries are almost always enough
+    for _ in range(_RANDOM_TRIES):
+        level = random.randrange(board.max_depth + 1)  # level <= max_depth
+        block = _get_block(board, _random_location(board), level)
+
+        actions = _block_moves(block, colour)
+        if len(actions) != 0:
+            return _create_move(random.choice(actions), block)
+
+    moves = list(_legal_moves(board, colour))
+    if len(moves) == 0:
+        return None
+    return random.choice(moves)
+
+
+def _quick_move(board: Block) -> Tuple[str, Optional[int], Block]:
+    """Return a randomly chosen move on <board>, which may fail or leave the
+    board unchanged.
+
+    A block is chosen as in _random_move, and then one of the actions that suit
+    its shape, without checking whether the action would change the board,
+    which makes this much cheaper than _random_move. Nothing is changed.
+    """
+    block = _get_block(board, _random_location(board),
+                       random.randrange(board.max_depth + 1))
+    if len(block.children) != 0:
+        actions = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,
+                   SWAP_HORIZONTAL, SWAP_VERTICAL]
+        if block.level == block.max_depth - 1:
+            actions.append(COMBINE)
+        return _create_move(random.choice(actions), block)
+    elif block.level != block.max_depth:
+        return _create_move(SMASH, block)
+    else:
+        return _create_move(PAINT, block)
+
+
+def _random_location(board: Block) -> Tuple[int, int]:
+    """Return a random location inside <board>, on which every unit cell of
+    <board> is equally likely to be.
+    """
+    return (board.position[0] + random.randrange(board.size),
+            board.position[1] + random.randrange(board.size))
+
+
+def _block_path(board: Block, block: Block) -> Tuple[int, ...]:
+    """Return the path to <block> from <board>.
+
+    A path is the indices of the children to go through, in order, to get
+    from <board> to the block.
+
+    Precondition: <block> is <board> or one of its descendants.
+    """
+    path = []
+    current = board
+    # <block> is compared by level rather than identity, since a LinearBlock
+    # gives out a new view of a child every time it is looked up
+    while current.level != block.level:
+        half_x = current.position[0] + current.size / 2
+        half_y = current.position[1] + current.size / 2
+        # the same quadrants as in _get_block
+        if block.position[0] >= half_x:
+            i = 3 if block.position[1] >= half_y else 0
+        else:
+            i = 2 if block.position[1] >= half_y else 1
+        path.append(i)
+        current = current.children[i]
+    return tuple(path)
+
+
+def _block_at(board: Block, path: Tuple[int, ...]) -> Optional[Block]:
+    """Return the block at <path> from <board>, as in _block_path, or None if
+    there is no such block.
+    """
+    block = board
+    for i in path:
+        children = block.children
+        if len(children) == 0:
+            return None
+        block = children[i]
+    return block
+
+
+def _move(block: Block, action: Tuple[str, Optional[int]],
+          journal: Optional[MoveJournal] = None,
+          colour: Optional[Tuple[int, int, int]] = None) -> bool:
     """Try to make the given <action> on the given <block>, return True if and
     only if the action is successful applied.
 
+    If <journal> is given, the action is made through it, so that it can be
+    undone. A paint uses <colour>, or a random colour if it is None.
+
     >>> block = Block((0, 0), 100, None, 0, 2)
     >>> child_pos = block._children_positions()
     >>> for i in range(4):
@@ -397,16 +1636,22 @@ def _move(block: Block, action: Tuple[str, Optional[int]]) -> bool:
     """
     colour_list = [(1, 128, 181), (199, 44, 58), (138, 151, 71), (255, 211, 92)]
 
+    if journal is None:
+        # nobody will undo the action
+        journal = MoveJournal()
+
     if action[0] == 'rotate':
-        is_valid = block.rotate(action[1])
+        is_valid = journal.rotate(block, action[1])
     elif action[0] == 'swap':
-        is_valid = block.swap(action[1])
+        is_valid = journal.swap(block, action[1])
     elif action[0] == 'smash':
-        is_valid = block.smash()
+        is_valid = journal.smash(block)
     elif action[0] == 'combine':
-        is_valid = block.combine()
+        is_valid = journal.combine(block)
+    elif colour is not None:
+        is_valid = journal.paint(block, colour)
     else:
-        is_valid = block.paint(random.choice(colour_list))
+        is_valid = journal.paint(block, random.choice(colour_list))
     return is_valid
 
 
@@ -417,7 +1662,8 @@ if __name__ == '__main__':
         'allowed-io': ['process_event'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
-            'goal', 'pygame', '__future__'
+            'goal', 'pygame', '__future__', 'settings', 'concurrent.futures',
+            'time', 'math', 'threading'
         ],
         'max-attributes': 10,
         'generated-members': 'pygame.*'
@@ -55,6 +55,10 @@ HIGHLIGHT_THICKNESS = 5
 # The number of seconds a move is animated for.
 ANIMATION_DURATION = 1
 
+# The number of goal scores that are remembered, for boards that are scored
+# more than once.
+SCORE_CACHE_SIZE = 4096
+
 
 def colour_name(colour: Tuple[int, int, int]) -> str:
     """Return the colour name associated with this colour value, or the empty
@@ -0,0 +1,226 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the data of a Blocky game, and a runner that plays whole
+games without pygame, for simulating many games quickly.
+
+Nothing in this file, or in the files it imports, imports pygame: the games
+are played without a display, without animations and without waiting for
+events, one turn right after the other.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Tuple
+
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
+from block import Block, generate_board
+from goal import score_goals, SCORE_CACHE
+from player import Player
+from settings import BOARD_SIZE
+
+
+class GameData:
+    """
+    A bundle of the data needed for a Blocky game.
+
+    === Public Attributes ===
+    max_turns:
+        The maximum number of turns for the game.
+    board:
+        The Blocky board on which this game will be played.
+    players:
+        The entities that are playing this game.
+    smashes:
+        The number of smashes done by each player.
+    combines:
+        The number of combines done by each player.
+    paints:
+        The number of paints done by each player.
+
+    === Representation Invariants ===
+    - len(players) >= 1
+    """
+    max_turns: int
+    board: Block
+    players: List[Player]
+    smashes: Dict[int, int]
+    combines: Dict[int, int]
+    paints: Dict[int, int]
+
+    def __init__(self, board: Block, players: List[Player]) -> None:
+        """Initialize the game data, saving a reference to <board> and
+        <players>.
+
+        Precondition:
+            - len(players) >= 1
+        """
+        self.max_turns = 0
+        self.board = board
+        self.players = players
+
+        self.smashes = {}
+        self.combines = {}
+        self.paints = {}
+
+        # Start off all counts at 0
+        for player in players:
+            self.smashes[player.id] = 0
+            self.combines[player.id] = 0
+            self.paints[player.id] = 0
+
+        # Let the players know the others, in the order they move
+        for i in range(len(players)):
+            players[i].set_opponents(players[i + 1:] + players[:i])
+
+    def make_move(self, player: Player,
+                  move: Tuple[str, Optional[int], Block]) -> bool:
+        """Attempt to do <move> on <board> for <player>, and return True iff
+        it was successful.
+
+        A paint uses the colour of <player>'s goal. The smashes, combines and
+        paints of <player> are counted.
+        """
+        action = (move[0], move[1])
+        direction = move[1]
+        block = move[2]
+        move_successful = False
+
+        if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
+            move_successful = block.rotate(direction)
+        elif action in [SWAP_HORIZONTAL, SWAP_VERTICAL]:
+            move_successful = block.swap(direction)
+        elif action == SMASH:
+            move_successful = block.smash()
+            self.smashes[player.id] += int(move_successful)
+        elif action == PAINT:
+            move_successful = block.paint(player.goal.colour)
+            self.paints[player.id] += int(move_successful)
+        elif action == COMBINE:
+            move_successful = block.combine()
+            self.combines[player.id] += int(move_successful)
+        elif action == PASS:
+            # Do nothing
+            move_successful = True
+
+        return move_successful
+
+    def calculate_score(self, player_id: int) -> Tuple[int, int]:
+        """Return a tuple containing first the <player_id>'s score based on
+        their goal in the game and second the deductions from their score based
+        on the actions they've taken.
+        """
+        goal_score = SCORE_CACHE.score(self.players[player_id].goal,
+                                       self.board)
+
+        return goal_score, self._penalty(player_id)
+
+    def calculate_scores(self) -> List[Tuple[int, int]]:
+        """Return a list containing calculate_score(player.id) for every
+        player, in the order of <players>.
+
+        All of the goals are scored together, from a single pass over the
+        board.
+        """
+        goal_scores = score_goals(self.board,
+                                  [player.goal for player in self.players])
+
+        scores = []
+        for player, goal_score in zip(self.players, goal_scores):
+            scores.append((goal_score, self._penalty(player.id)))
+
+        return scores
+
+    def close_players(self) -> None:
+        """Tell every player that the game is over, so that it can release
+        anything it keeps to generate its moves.
+        """
+        for player in self.players:
+            player.close()
+
+    def _penalty(self, player_id: int) -> int:
+        """Return the deductions from <player_id>'s score based on the actions
+        they've taken.
+        """
+        return (self.smashes[player_id] * ACTION_PENALTY[SMASH] +
+                self.combines[player_id] * ACTION_PENALTY[COMBINE] +
+                self.paints[player_id] * ACTION_PENALTY[PAINT])
+
+
+def play_game(data: GameData) -> List[Tuple[int, int]]:
+    """Play a whole game of <data>.max_turns turns on <data>.board, and return
+    the goal score and the penalty of each player, in the order of
+    <data>.players.
+
+    The players move in turn as in the game, but each one is told to proceed
+    right away instead of waiting for a click. A player who generates no move,
+    or a move that is not valid, passes, since no one can tell it to try
+    again.
+
+    Precondition: No player in <data>.players is a HumanPlayer.
+    """
+    for turn in range(data.max_turns):
+        for player in data.players:
+            player.turns_left = data.max_turns - turn
+            player.proceed()
+            move = player.generate_move(data.board)
+            if move is not None:
+                data.make_move(player, move)
+
+    data.close_players()
+    return data.calculate_scores()
+
+
+def simulate_games(num_games: int, max_depth: int, num_turns: int,
+                   create_players: Callable[[], List[Player]]) -> \
+        List[List[Tuple[int, int]]]:
+    """Play <num_games> games of <num_turns> turns each, and return the goal
+    scores and penalties of the players of each game, as given by play_game.
+
+    Each game is played on a new random board with <max_depth>, by the new
+    players that <create_players> returns for it.
+
+    Precondition: 0 <= max_depth <= 5
+
+    >>> from player import RandomPlayer
+    >>> from goal import generate_goals
+    >>> results = simulate_games(3, 2, 4, lambda: [
+    ...     RandomPlayer(i, goal) for i, goal in enumerate(generate_goals(2))])
+    >>> len(results) == 3 and all(len(scores) == 2 for scores in results)
+    True
+    """
+    results = []
+    for _ in range(num_games):
+        data = GameData(generate_board(max_depth, BOARD_SIZE),
+                        create_players())
+        data.max_turns = num_turns
+        results.append(play_game(data))
+    return results
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__',
+            'actions', 'block', 'goal', 'player', 'settings'
+        ]
+    })
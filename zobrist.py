@@ -0,0 +1,80 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the 64-bit keys used to hash the structure of a board.
+
+Every leaf gets a fixed pseudo-random key that depends only on its level and
+colour, in the spirit of Zobrist hashing. The key of a block with children is
+mixed from its level and the keys of its children, in order. Both Block and
+LinearBlock use these functions, so equal boards get equal keys with either
+representation, and the keys are the same from one run of the program to the
+next.
+"""
+from typing import List, Tuple
+
+# All keys are reduced modulo 2 ** 64.
+MASK = (1 << 64) - 1
+
+# An odd constant used to tell the four children of a block apart.
+_CHILD_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def _mix(value: int) -> int:
+    """Return a well-scrambled 64-bit integer computed from <value>.
+
+    This is the finalizer of the SplitMix64 generator.
+
+    >>> _mix(0)
+    0
+    >>> _mix(1) == _mix(1)
+    True
+    """
+    value &= MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK
+    return value ^ (value >> 31)
+
+
+def leaf_key(level: int, colour: Tuple[int, int, int]) -> int:
+    """Return the key of a leaf of <colour> at <level>.
+    """
+    red, green, blue = colour
+    return _mix(((level + 1) << 32) | (red << 16) | (green << 8) | blue)
+
+
+def parent_key(level: int, keys: List[int]) -> int:
+    """Return the key of a block at <level> whose four children, in the order
+    of Block.children, have the given <keys>.
+    """
+    key = _mix(level + 0x5A5A5A5A)
+    for child_key in keys:
+        key = _mix(key * _CHILD_MULTIPLIER + child_key)
+    return key
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing'
+        ]
+    })